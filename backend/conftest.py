@@ -0,0 +1 @@
+# pytest 以 backend/ 為根目錄（processors / models 等以頂層模組匯入）
@@ -10,8 +10,14 @@ from routers.site import router as site_router
 from routers.visualize import router as visualize_router
 from routers.data import router as data_router
 from routers.unit_adjustment import router as unit_router 
+from routers.jobs import router as jobs_router
+from processors.jobs import resume_pending_jobs
+from processors.partitions import ensure_default_partition, ensure_upcoming_partitions
 
 Base.metadata.create_all(bind=engine)
+ensure_default_partition(engine)
+# 接下來幾個月的分區先建好，一般上傳不用在匯入途中拿 site_data 的排他鎖
+ensure_upcoming_partitions(engine)
 
 app = FastAPI()
 
@@ -31,6 +37,14 @@ app.include_router(site_router)
 app.include_router(visualize_router)
 app.include_router(data_router)
 app.include_router(unit_router)
+app.include_router(jobs_router)
+
+
+@app.on_event("startup")
+def resume_ingest_jobs():
+    # 上次關機時還沒跑完的背景匯入，重新排入 worker
+    resume_pending_jobs()
+
 
 @app.get("/")
 def root():
@@ -0,0 +1,28 @@
+-- 001：site_data 每個 (site_id, the_date, the_hour) 只保留一筆，並建立唯一索引
+-- 新安裝由 Base.metadata.create_all 建立；既有資料庫執行一次：
+--   psql "$DATABASE_URL" -f migrations/001_site_data_unique_hour.sql
+
+BEGIN;
+
+-- 每組重複只留 data_id 最小的那筆（跟舊的讀取端 drop_duplicates(keep="first") 一致）
+CREATE TEMP TABLE site_data_dup ON COMMIT DROP AS
+SELECT data_id,
+       min(data_id) OVER (PARTITION BY site_id, the_date, the_hour) AS keep_id
+FROM site_data;
+
+DELETE FROM site_data_dup WHERE data_id = keep_id;
+
+-- after_data 指到被刪掉的列時，改指向保留的那筆
+UPDATE after_data a
+SET data_id = d.keep_id
+FROM site_data_dup d
+WHERE a.data_id = d.data_id;
+
+DELETE FROM site_data s
+USING site_data_dup d
+WHERE s.data_id = d.data_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_site_data_site_date_hour
+    ON site_data (site_id, the_date, the_hour);
+
+COMMIT;
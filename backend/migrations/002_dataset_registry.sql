@@ -0,0 +1,55 @@
+-- 002：建立 dataset 表，既有 site_data 依 (site_id, data_name) 分組回填 dataset_id
+--   psql "$DATABASE_URL" -f migrations/002_dataset_registry.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS dataset (
+    dataset_id     serial PRIMARY KEY,
+    site_id        integer NOT NULL REFERENCES site (site_id),
+    file_name      varchar NOT NULL,
+    row_count      integer NOT NULL DEFAULT 0,
+    min_date       date,
+    max_date       date,
+    column_mapping jsonb,
+    unit           varchar NOT NULL DEFAULT 'kWh/m²',
+    uploaded_at    timestamp
+);
+CREATE INDEX IF NOT EXISTS ix_dataset_dataset_id ON dataset (dataset_id);
+CREATE INDEX IF NOT EXISTS ix_dataset_site_id ON dataset (site_id);
+CREATE INDEX IF NOT EXISTS ix_dataset_file_name ON dataset (file_name);
+
+ALTER TABLE site_data
+    ADD COLUMN IF NOT EXISTS dataset_id integer REFERENCES dataset (dataset_id);
+ALTER TABLE after_data
+    ADD COLUMN IF NOT EXISTS dataset_id integer REFERENCES dataset (dataset_id);
+
+-- 每個 (site_id, data_name) 視為一次上傳
+INSERT INTO dataset (site_id, file_name, row_count, min_date, max_date, uploaded_at)
+SELECT site_id,
+       coalesce(data_name, ''),
+       count(*),
+       min(the_date),
+       max(the_date),
+       min(created_at)
+FROM site_data
+WHERE dataset_id IS NULL
+GROUP BY site_id, coalesce(data_name, '');
+
+UPDATE site_data s
+SET dataset_id = d.dataset_id
+FROM dataset d
+WHERE s.dataset_id IS NULL
+  AND d.site_id = s.site_id
+  AND d.file_name = coalesce(s.data_name, '');
+
+UPDATE after_data a
+SET dataset_id = s.dataset_id
+FROM site_data s
+WHERE a.dataset_id IS NULL
+  AND s.data_id = a.data_id;
+
+CREATE INDEX IF NOT EXISTS ix_site_data_dataset_date_hour
+    ON site_data (dataset_id, the_date, the_hour);
+CREATE INDEX IF NOT EXISTS ix_after_data_dataset_id ON after_data (dataset_id);
+
+COMMIT;
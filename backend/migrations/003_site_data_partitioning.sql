@@ -0,0 +1,76 @@
+-- 003：site_data 改成依月份 RANGE (the_date) 分區，並搬移既有資料
+--   psql "$DATABASE_URL" -f migrations/003_site_data_partitioning.sql
+-- 需要先跑過 001 / 002。搬資料期間 site_data 會被鎖住，請在離峰時間執行。
+
+BEGIN;
+
+-- 分區表的唯一鍵必須包含 the_date，after_data.data_id 不能再當 FK
+ALTER TABLE after_data DROP CONSTRAINT IF EXISTS after_data_data_id_fkey;
+
+-- 舊表與其索引改名（索引名稱是 schema 內唯一）
+ALTER TABLE site_data RENAME TO site_data_old;
+ALTER INDEX IF EXISTS site_data_pkey RENAME TO site_data_old_pkey;
+ALTER INDEX IF EXISTS ix_site_data_data_id RENAME TO ix_site_data_old_data_id;
+ALTER INDEX IF EXISTS uq_site_data_site_date_hour RENAME TO uq_site_data_old_site_date_hour;
+ALTER INDEX IF EXISTS ix_site_data_dataset_date_hour RENAME TO ix_site_data_old_dataset_date_hour;
+
+-- data_id 序號沿用，避免 id 重複
+ALTER SEQUENCE site_data_data_id_seq OWNED BY NONE;
+
+CREATE TABLE site_data (
+    data_id    integer NOT NULL DEFAULT nextval('site_data_data_id_seq'),
+    site_id    integer NOT NULL REFERENCES site (site_id),
+    -- 不設 FK：建新月份分區會複製 FK 並鎖住 dataset，和正在上傳（已 INSERT dataset）的 transaction 互等
+    dataset_id integer,
+    the_date   date NOT NULL,
+    the_hour   integer NOT NULL,
+    gi         double precision,
+    tm         double precision,
+    eac        double precision,
+    data_name  varchar,
+    created_at timestamp,
+    PRIMARY KEY (data_id, the_date)
+) PARTITION BY RANGE (the_date);
+
+ALTER SEQUENCE site_data_data_id_seq OWNED BY site_data.data_id;
+
+CREATE TABLE site_data_default PARTITION OF site_data DEFAULT;
+
+-- 既有資料涵蓋的每個月份各一個分區（名稱與 processors/partitions.py 一致）
+DO $$
+DECLARE
+    m date;
+BEGIN
+    FOR m IN
+        SELECT generate_series(
+            date_trunc('month', min(the_date)),
+            date_trunc('month', max(the_date)),
+            interval '1 month'
+        )::date
+        FROM site_data_old
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF site_data FOR VALUES FROM (%L) TO (%L)',
+            'site_data_p' || to_char(m, 'YYYYMM'),
+            m,
+            (m + interval '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+-- 依日期順序搬入，讓每個分區在實體上按時間排列（BRIN 才有效）
+INSERT INTO site_data (data_id, site_id, dataset_id, the_date, the_hour, gi, tm, eac, data_name, created_at)
+SELECT data_id, site_id, dataset_id, the_date, the_hour, gi, tm, eac, data_name, created_at
+FROM site_data_old
+ORDER BY the_date, the_hour, site_id;
+
+CREATE INDEX ix_site_data_data_id ON site_data (data_id);
+CREATE UNIQUE INDEX uq_site_data_site_date_hour ON site_data (site_id, the_date, the_hour);
+CREATE INDEX ix_site_data_dataset_date_hour ON site_data (dataset_id, the_date, the_hour);
+CREATE INDEX ix_site_data_the_date_brin ON site_data USING brin (the_date);
+
+DROP TABLE site_data_old;
+
+COMMIT;
+
+ANALYZE site_data;
@@ -0,0 +1,4 @@
+-- 004：dataset.version，資料變動時遞增，欄式快照依 (dataset_id, version) 命名
+--   psql "$DATABASE_URL" -f migrations/004_dataset_version.sql
+
+ALTER TABLE dataset ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1;
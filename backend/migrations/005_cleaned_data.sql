@@ -0,0 +1,13 @@
+-- 005：清理後資料實體化，以 after_id 對應 after_data（含逐列離群值標記）
+--   psql "$DATABASE_URL" -f migrations/005_cleaned_data.sql
+
+CREATE TABLE IF NOT EXISTS cleaned_data (
+    after_id   integer NOT NULL REFERENCES after_data (after_id) ON DELETE CASCADE,
+    the_date   date NOT NULL,
+    the_hour   integer NOT NULL,
+    gi         double precision,
+    tm         double precision,
+    eac        double precision,
+    is_outlier boolean NOT NULL DEFAULT false,
+    PRIMARY KEY (after_id, the_date, the_hour)
+);
@@ -0,0 +1,13 @@
+-- 006：相關係數的充分統計量（每個 dataset × stage 一列），上傳 / 資料變動時重算
+--   psql "$DATABASE_URL" -f migrations/006_dataset_moments.sql
+-- 既有 dataset 不用回填：查詢時發現沒有（或 version 過期）會直接在資料庫算
+
+CREATE TABLE IF NOT EXISTS dataset_moments (
+    dataset_id integer NOT NULL REFERENCES dataset (dataset_id) ON DELETE CASCADE,
+    stage      varchar NOT NULL,
+    version    integer NOT NULL,
+    n          bigint NOT NULL DEFAULT 0,
+    sums       double precision[] NOT NULL,
+    products   double precision[] NOT NULL,
+    PRIMARY KEY (dataset_id, stage)
+);
@@ -0,0 +1,5 @@
+-- 007：GI 換單位改成記錄倍率（讀取時 gi × gi_scale），不改寫 site_data
+--   psql "$DATABASE_URL" -f migrations/007_dataset_gi_scale.sql
+
+ALTER TABLE dataset
+    ADD COLUMN IF NOT EXISTS gi_scale double precision NOT NULL DEFAULT 1;
@@ -0,0 +1,6 @@
+-- 008：ingest_job 加上 on_conflict（skip / overwrite / error）
+--   psql "$DATABASE_URL" -f migrations/008_ingest_job_on_conflict.sql
+-- 還沒有 ingest_job 的資料庫（之後由 Base.metadata.create_all 建立，已含此欄）直接略過
+
+ALTER TABLE IF EXISTS ingest_job
+    ADD COLUMN IF NOT EXISTS on_conflict varchar NOT NULL DEFAULT 'overwrite';
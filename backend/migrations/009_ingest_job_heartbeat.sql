@@ -0,0 +1,6 @@
+-- 009：ingest_job 加上 heartbeat_at（running 時每次回報進度更新）
+--   psql "$DATABASE_URL" -f migrations/009_ingest_job_heartbeat.sql
+-- 服務重啟時只把 heartbeat 過期的 running job 改回 queued，不會搶走其他 process 正在跑的 job
+
+ALTER TABLE IF EXISTS ingest_job
+    ADD COLUMN IF NOT EXISTS heartbeat_at timestamp;
@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Date
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Float, Date, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy import Boolean, String
 
 
@@ -31,16 +31,53 @@ class Site(Base):
 
     owner = relationship("User", back_populates="sites")
     site_data = relationship("SiteData", back_populates="site", cascade="all, delete")
+    datasets = relationship("Dataset", back_populates="site")
+
+
+class Dataset(Base):
+    __tablename__ = "dataset"
+
+    # 每次上傳一個 dataset，site_data 以 dataset_id 指回來
+    dataset_id = Column(Integer, primary_key=True, index=True)
+    site_id = Column(Integer, ForeignKey("site.site_id"), nullable=False, index=True)
+
+    file_name = Column(String, nullable=False, index=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    min_date = Column(Date, nullable=True)
+    max_date = Column(Date, nullable=True)
+
+    column_mapping = Column(JSONB, nullable=True)         # 內部欄位 -> 原始欄名
+    unit = Column(String, nullable=False, default="kWh/m²")  # GI 單位
+    gi_scale = Column(Float, nullable=False, default=1.0)    # 讀取時 GI 乘上的倍率（換單位不改寫資料列）
+    version = Column(Integer, nullable=False, default=1)     # 資料有變動就 +1（快照 / 快取依此失效）
+
+    uploaded_at = Column(DateTime, default=datetime.utcnow)
+
+    site = relationship("Site", back_populates="datasets")
 
 
 class SiteData(Base):
     __tablename__ = "site_data"
-
-    data_id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        # 同一案場同一小時只會有一筆（上傳用 INSERT ... ON CONFLICT）
+        Index("uq_site_data_site_date_hour", "site_id", "the_date", "the_hour", unique=True),
+        # 依 dataset 讀取並排序（visualize / save / unit 都走這個索引）
+        Index("ix_site_data_dataset_date_hour", "dataset_id", "the_date", "the_hour"),
+        # 每個月份分區內資料大致依日期寫入，BRIN 很小就能做範圍掃描
+        Index("ix_site_data_the_date_brin", "the_date", postgresql_using="brin"),
+        # 依月份分區（processors/partitions.py 負責建立分區）
+        {"postgresql_partition_by": "RANGE (the_date)"},
+    )
+
+    # 分區表的主鍵必須包含分區欄位 → (data_id, the_date)
+    data_id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     site_id = Column(Integer, ForeignKey("site.site_id"), nullable=False)
+    # 不設 FK：建立新月份分區時會複製 FK，需要鎖住 dataset，
+    # 而上傳的 transaction 已經 INSERT 了 dataset → 建分區的連線會一直等
+    dataset_id = Column(Integer, nullable=True)
 
     # 🔥 關鍵修正在這裡
-    the_date = Column(Date, nullable=False)    # ✅ 一定要 Date
+    the_date = Column(Date, primary_key=True, nullable=False)    # ✅ 一定要 Date
     the_hour = Column(Integer, nullable=False)
 
     gi = Column(Float, nullable=True)
@@ -52,14 +89,18 @@ class SiteData(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     site = relationship("Site", back_populates="site_data")
+    dataset = relationship(
+        "Dataset", primaryjoin="foreign(SiteData.dataset_id) == Dataset.dataset_id"
+    )
 
 class AfterData(Base):
     __tablename__ = "after_data"
 
     after_id = Column(Integer, primary_key=True, index=True)
 
-    # 對應原始 site_data
-    data_id = Column(Integer, ForeignKey("site_data.data_id"), nullable=False)
+    # 對應原始 site_data 的第一筆（site_data 分區後 data_id 不再是唯一鍵，無法設 FK）
+    data_id = Column(Integer, nullable=False)
+    dataset_id = Column(Integer, ForeignKey("dataset.dataset_id"), nullable=True, index=True)
 
     after_name = Column(String, nullable=False)
 
@@ -74,4 +115,59 @@ class AfterData(Base):
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    site_data = relationship("SiteData")
\ No newline at end of file
+    dataset = relationship("Dataset")
+
+class CleanedData(Base):
+    __tablename__ = "cleaned_data"
+
+    # 清理後的逐列資料（/save-cleaned-data/ 用 COPY 寫入，刪 after_data 時一起刪）
+    after_id = Column(
+        Integer, ForeignKey("after_data.after_id", ondelete="CASCADE"), primary_key=True
+    )
+    the_date = Column(Date, primary_key=True, nullable=False)
+    the_hour = Column(Integer, primary_key=True, nullable=False)
+
+    gi = Column(Float, nullable=True)
+    tm = Column(Float, nullable=True)
+    eac = Column(Float, nullable=True)
+
+    # 這一列是否被判定為離群值（已補值的列為 True）
+    is_outlier = Column(Boolean, nullable=False, default=False)
+
+class DatasetMoments(Base):
+    __tablename__ = "dataset_moments"
+
+    # 相關係數的充分統計量（n / 一次和 / 交叉乘積和），可直接相加合併多個 dataset
+    # 變數順序見 processors/moments.py CORR_VARIABLES；stage：raw / gi_tm
+    dataset_id = Column(
+        Integer, ForeignKey("dataset.dataset_id", ondelete="CASCADE"), primary_key=True
+    )
+    stage = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)   # 計算時的 dataset.version，不一致就視為過期
+
+    n = Column(BigInteger, nullable=False, default=0)
+    sums = Column(ARRAY(Float), nullable=False)       # Σx_i
+    products = Column(ARRAY(Float), nullable=False)   # Σx_i·x_j（上三角，含對角線，逐列展開）
+
+class IngestJob(Base):
+    __tablename__ = "ingest_job"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    site_id = Column(Integer, ForeignKey("site.site_id"), nullable=False)
+
+    file_name = Column(String, nullable=False)
+    spool_path = Column(String, nullable=False)        # 上傳檔暫存在本機的路徑
+    max_errors = Column(Integer, nullable=False)
+    on_conflict = Column(String, nullable=False, default="overwrite")  # skip / overwrite / error
+
+    status = Column(String, nullable=False, default="queued")  # queued / running / succeeded / failed
+    phase = Column(String, nullable=True)                      # parsing / validating / writing
+    rows_processed = Column(Integer, nullable=False, default=0)
+
+    result = Column(JSONB, nullable=True)   # 成功：跟同步上傳一樣的回傳內容
+    error = Column(JSONB, nullable=True)    # 失敗：欄位錯誤 / 驗證報告 / 例外訊息
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # running 時每次回報進度更新（判斷 worker 是否還活著）
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,138 @@
+# processors/browse.py
+from datetime import date, datetime
+from typing import Iterator
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from models import CleanedData, Dataset, SiteData
+
+# 可以選的欄位（the_date / the_hour 一定會回傳，當作分頁的 key）
+RAW_COLUMNS = ("gi", "tm", "eac")
+CLEANED_COLUMNS = ("gi", "tm", "eac", "is_outlier")
+
+DEFAULT_PAGE_ROWS = 500
+MAX_PAGE_ROWS = 5000
+
+# cursor 格式：上一頁最後一列的 "YYYY-MM-DDTHH"
+_CURSOR_FORMAT = "%Y-%m-%dT%H"
+
+
+def encode_cursor(the_date: date, the_hour: int) -> str:
+    return f"{the_date.isoformat()}T{the_hour:02d}"
+
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    """'2024-01-01T05' → (date(2024, 1, 1), 5)；格式錯誤丟 ValueError"""
+    ts = datetime.strptime(cursor, _CURSOR_FORMAT)
+    return ts.date(), ts.hour
+
+
+def _page(
+    db: Session,
+    model,
+    key_filter,
+    columns: list[str],
+    *,
+    cursor: str | None,
+    limit: int,
+    start: date | None,
+    end: date | None,
+    gi_scale: float = 1.0,
+) -> dict:
+    """
+    keyset 分頁：WHERE (the_date, the_hour) > cursor ORDER BY the_date, the_hour LIMIT n
+    走 (key, the_date, the_hour) 索引，翻到多深都一樣快（不用 OFFSET）
+    多取一列判斷還有沒有下一頁
+    """
+    exprs = [model.the_date, model.the_hour]
+    for c in columns:
+        if c == "gi" and gi_scale != 1.0:
+            # 換過單位的 dataset：GI 讀取時乘上 gi_scale
+            exprs.append((model.gi * gi_scale).label("gi"))
+        else:
+            exprs.append(getattr(model, c))
+
+    stmt = select(*exprs).where(key_filter)
+    if cursor:
+        after_date, after_hour = decode_cursor(cursor)
+        # 多加 the_date >= 讓分區表可以直接略過前面的月份
+        stmt = stmt.where(
+            model.the_date >= after_date,
+            tuple_(model.the_date, model.the_hour) > tuple_(after_date, after_hour),
+        )
+    if start is not None:
+        stmt = stmt.where(model.the_date >= start)
+    if end is not None:
+        stmt = stmt.where(model.the_date <= end)
+    stmt = stmt.order_by(model.the_date, model.the_hour).limit(limit + 1)
+
+    rows = db.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "columns": ["the_date", "the_hour", *columns],
+        "rows": [
+            {"the_date": r[0].isoformat(), "the_hour": r[1], **dict(zip(columns, r[2:]))}
+            for r in rows
+        ],
+        "next_cursor": encode_cursor(rows[-1][0], rows[-1][1]) if has_more else None,
+    }
+
+
+def site_rows_page(
+    db: Session,
+    dataset: Dataset,
+    columns=RAW_COLUMNS,
+    *,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_ROWS,
+    start: date | None = None,
+    end: date | None = None,
+) -> dict:
+    """dataset 原始資料的一頁"""
+    return _page(
+        db,
+        SiteData,
+        SiteData.dataset_id == dataset.dataset_id,
+        list(columns),
+        cursor=cursor,
+        limit=limit,
+        start=start,
+        end=end,
+        gi_scale=dataset.gi_scale,
+    )
+
+
+def cleaned_rows_page(
+    db: Session,
+    after_id: int,
+    columns=CLEANED_COLUMNS,
+    *,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_ROWS,
+    start: date | None = None,
+    end: date | None = None,
+) -> dict:
+    """/save-cleaned-data/ 存下來的清理後資料的一頁（主鍵 (after_id, the_date, the_hour)）"""
+    return _page(
+        db,
+        CleanedData,
+        CleanedData.after_id == after_id,
+        list(columns),
+        cursor=cursor,
+        limit=limit,
+        start=start,
+        end=end,
+    )
+
+
+def iter_pages(page_func, *args, cursor: str | None = None, **kwargs) -> Iterator[dict]:
+    """沿著 next_cursor 一頁一頁往下讀（串流輸出用），每頁都是獨立的 keyset 查詢"""
+    while True:
+        page = page_func(*args, cursor=cursor, **kwargs)
+        yield page
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return
@@ -0,0 +1,42 @@
+# processors/cleaned.py
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from processors.cleaning import OUTLIER_FLAG
+from processors.ingest import COPY_CHUNK_ROWS, copy_frame
+
+
+def cleaned_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    清理流程輸出（EAC / GI / TM / the_date / hour ...）→ cleaned_data 欄位
+    型別和 dataloader 讀回來的一致（float32 / int8 / bool），可直接寫快照
+    """
+    flag = df[OUTLIER_FLAG] if OUTLIER_FLAG in df.columns else False
+    return pd.DataFrame(
+        {
+            "the_date": df["the_date"],
+            "the_hour": df["hour"].astype(np.int8),
+            "gi": df["GI"].astype(np.float32),
+            "tm": df["TM"].astype(np.float32),
+            "eac": df["EAC"].astype(np.float32),
+            "is_outlier": pd.Series(flag, index=df.index).astype(bool),
+        }
+    ).sort_values(["the_date", "the_hour"]).reset_index(drop=True)
+
+
+def save_cleaned_rows(
+    db: Session, after_id: int, rows: pd.DataFrame, *, chunk_size: int = COPY_CHUNK_ROWS
+) -> int:
+    """cleaned_rows() 的結果 COPY 進 cleaned_data（共用 Session 的 transaction，不 commit）"""
+    frame = rows.copy()
+    frame.insert(0, "after_id", after_id)
+    frame["the_date"] = frame["the_date"].dt.strftime("%Y-%m-%d")
+
+    cursor = db.connection().connection.cursor()
+    try:
+        for start in range(0, len(frame), chunk_size):
+            copy_frame(db, cursor, "cleaned_data", frame.iloc[start:start + chunk_size])
+    finally:
+        cursor.close()
+    return len(frame)
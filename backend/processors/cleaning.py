@@ -0,0 +1,375 @@
+# processors/cleaning.py
+import hashlib
+import json
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sqlalchemy.orm import Session
+
+from models import Dataset
+from processors.hourgrid import MAX_GAP_HOURS, fill_columns, hour_index
+from processors.resultcache import isoforest_cache, pipeline_cache
+from processors.snapshots import ANALYSIS_COLUMNS, load_dataset_frame
+
+OUTLIER_METHODS = ("none", "iqr", "iqr_single", "zscore", "isolation_forest", "seasonal_robust")
+
+# detect_outliers 步驟輸出的標記欄位
+OUTLIER_FLAG = "is_outlier"
+
+# zscore / seasonal_robust 的預設門檻（API 參數 z_threshold）
+DEFAULT_Z_THRESHOLD = 3.0
+
+# MAD → 常態分布標準差的換算係數
+MAD_SCALE = 1.4826
+# (month, hour) 組內有效值少於這個數就不判斷（MAD 不穩定）
+SEASONAL_MIN_GROUP = 10
+
+# Isolation Forest 樹數 / 每棵樹抽樣上限
+ISOFOREST_TREES = 100
+ISOFOREST_MAX_SAMPLES = 256
+
+
+# ===============================
+# 離群值偵測（visualize / save / DataProcessor 共用同一份）
+# ===============================
+def outlier_columns(method: str) -> list[str]:
+    if method == "iqr_single":
+        return ["EAC"]
+    return ["EAC", "GI", "TM"]
+
+
+def iqr_mask(df: pd.DataFrame, cols, iqr_factor: float = 1.5) -> pd.Series:
+    mask = pd.Series(False, index=df.index)
+    for col in cols:
+        s = df[col].dropna()
+        if len(s) < 10:
+            continue
+        q1, q3 = s.quantile([0.25, 0.75])
+        iqr = q3 - q1
+        if iqr == 0:
+            continue
+        lower = q1 - iqr_factor * iqr
+        upper = q3 + iqr_factor * iqr
+        mask |= (df[col] < lower) | (df[col] > upper)
+    return mask
+
+
+def zscore_mask(df: pd.DataFrame, cols, threshold: float = DEFAULT_Z_THRESHOLD) -> pd.Series:
+    mask = pd.Series(False, index=df.index)
+    for col in cols:
+        s = df[col].dropna()
+        if len(s) == 0 or s.std() == 0:
+            continue
+        z = np.abs((df[col] - s.mean()) / s.std())
+        mask |= z > threshold
+    return mask
+
+
+def isolation_scores(sub: pd.DataFrame, random_state: int = 42) -> np.ndarray:
+    """
+    每列的 score_samples（越小越異常），同一份輸入（內容 hash）、欄位、random_state 只訓練一次
+    - 每棵樹最多抽 ISOFOREST_MAX_SAMPLES 列，和 sklearn max_samples="auto" 相同
+    - n_jobs=-1 用全部核心；樹的亂數種子事先決定，結果和單執行緒一致
+    """
+    digest = hashlib.sha1(
+        pd.util.hash_pandas_object(sub, index=True).to_numpy().tobytes()
+    ).hexdigest()
+    key = (digest, tuple(sub.columns), random_state)
+    scores = isoforest_cache.get(key)
+    if scores is None:
+        iso = IsolationForest(
+            n_estimators=ISOFOREST_TREES,
+            max_samples=min(ISOFOREST_MAX_SAMPLES, len(sub)),
+            n_jobs=-1,
+            random_state=random_state,
+        ).fit(sub)
+        scores = iso.score_samples(sub)
+        isoforest_cache.put(key, scores)
+    return scores
+
+
+def isolation_forest_mask(
+    df: pd.DataFrame, cols, contamination: float = 0.1, random_state: int = 42
+) -> pd.Series:
+    """
+    contamination 只決定門檻（sklearn 的 offset_ 就是 score 的 contamination 百分位數），
+    所以改 contamination 只要重新切門檻，不用重新訓練；結果和 fit_predict 相同
+    """
+    mask = pd.Series(False, index=df.index)
+    sub = df[list(cols)].dropna()
+    if len(sub) > 20:
+        scores = isolation_scores(sub, random_state)
+        mask.loc[sub.index] = scores < np.percentile(scores, 100.0 * contamination)
+    return mask
+
+
+def _robust_z(values: pd.Series, codes: np.ndarray) -> np.ndarray:
+    """組內 |x - median| / (1.4826 * MAD)；MAD = 0 或組太小 → NaN"""
+    x = values.to_numpy(dtype=float)
+    median = values.groupby(codes).transform("median").to_numpy(dtype=float)
+    deviation = np.abs(x - median)
+    mad = pd.Series(deviation).groupby(codes).transform("median").to_numpy(dtype=float)
+    count = np.bincount(codes[~np.isnan(x)], minlength=codes.max() + 1)[codes]
+    mad = np.where((mad > 0) & (count >= SEASONAL_MIN_GROUP), mad * MAD_SCALE, np.nan)
+    return deviation / mad
+
+
+def seasonal_robust_z(df: pd.DataFrame, cols, use_ratio: bool = True) -> np.ndarray:
+    """
+    每列在同 (month, hour) 組內的最大 robust z（groupby transform，線性時間）
+    - 中午高峰只跟同月份的中午比，10 點的低值也不會被中午拉高的分布蓋掉
+    - use_ratio：另外檢查 EAC / GI（performance ratio），抓「有日照但發電偏低」的列
+    無法判斷的列為 -inf
+    """
+    if df.empty:
+        return np.empty(0)
+    month = df["month"] if "month" in df.columns else df["the_date"].dt.month
+    # (month, hour) 編成單一整數代碼，groupby 不用每次建 MultiIndex
+    codes = month.to_numpy(dtype=np.int64) * 24 + df["hour"].to_numpy(dtype=np.int64)
+
+    critical = np.full(len(df), -np.inf)
+    for col in cols:
+        critical = np.fmax(critical, _robust_z(df[col], codes))
+    if use_ratio and {"EAC", "GI"} <= set(df.columns):
+        ratio = df["EAC"] / df["GI"].where(df["GI"] > 0)
+        critical = np.fmax(critical, _robust_z(ratio, codes))
+    return critical
+
+
+def seasonal_robust_mask(
+    df: pd.DataFrame, cols, threshold: float = DEFAULT_Z_THRESHOLD, use_ratio: bool = True
+) -> pd.Series:
+    return pd.Series(seasonal_robust_z(df, cols, use_ratio) > threshold, index=df.index)
+
+
+def outlier_mask(df: pd.DataFrame, method: str, cols, param: float, **options) -> pd.Series:
+    """
+    param：iqr → iqr_factor、zscore / seasonal_robust → 門檻、isolation_forest → contamination
+    options：seasonal_robust 的 use_ratio
+    """
+    if method.startswith("iqr"):
+        return iqr_mask(df, cols, param)
+    if method == "zscore":
+        return zscore_mask(df, cols, param)
+    if method == "isolation_forest":
+        return isolation_forest_mask(df, cols, param)
+    if method == "seasonal_robust":
+        return seasonal_robust_mask(df, cols, param, **options)
+    raise ValueError(f"不支援的 outlier_method: {method}")
+
+
+# ===============================
+# 清理步驟：輸入 DataFrame → 新的 DataFrame（不修改輸入，輸出會被快取共用）
+# ===============================
+def _calendar(df: pd.DataFrame) -> pd.DataFrame:
+    # (site_id, the_date, the_hour) 有唯一索引，不需要再 drop_duplicates
+    df = df.copy()
+    df["month"] = df["the_date"].dt.month
+    df["day"] = df["the_date"].dt.day
+    return df
+
+
+def _gi_tm(df: pd.DataFrame, max_gap: int = MAX_GAP_HOURS) -> pd.DataFrame:
+    # GI / TM 清理（和 notebook 同步）：不合理的 TM 設為 NaN，在完整的小時格點上依時間內插
+    # （夜間的列也參與內插），再只留 GI > 0 的日照時段；超過 max_gap 小時的空缺不補
+    df = df.copy()
+    df.loc[df["TM"] <= 0, "TM"] = np.nan
+    df = fill_columns(df, ["TM"], max_gap=max_gap)
+    return df[df["GI"] > 0]
+
+
+def _detect_outliers(
+    df: pd.DataFrame, method: str, cols: tuple, param: float, **options
+) -> pd.DataFrame:
+    df = df.copy()
+    df[OUTLIER_FLAG] = outlier_mask(df, method, list(cols), param, **options)
+    return df
+
+
+def _fill_run_edges(df: pd.DataFrame, cols: list, max_gap: int) -> pd.DataFrame:
+    """
+    時間內插補不到、位在一段連續小時頭尾的離群值（例如清晨 / 傍晚緊鄰被 GI > 0 濾掉的夜間），
+    在同一段內依列順序補：開頭用該段第一個有效值、結尾用最後一個有效值
+    頭尾連續超過 max_gap 列、或整段都沒有有效值就不補
+    """
+    if df.empty:
+        return df
+    index = hour_index(df["the_date"].to_numpy(), df["hour"].to_numpy())
+    order = np.argsort(index, kind="stable")
+    # 相鄰兩列差一小時就屬於同一段
+    segment = np.concatenate(([0], np.cumsum(np.diff(index[order]) != 1)))
+    flagged = df[OUTLIER_FLAG].to_numpy()[order]
+
+    df = df.copy()
+    for col in cols:
+        values = pd.Series(df[col].to_numpy(dtype=float)[order])
+        valid = values.notna().to_numpy()
+        before = pd.Series(valid).groupby(segment).cumsum().to_numpy() > 0
+        after = pd.Series(valid[::-1]).groupby(segment[::-1]).cumsum().to_numpy()[::-1] > 0
+        leading = ~before & after
+        trailing = before & ~after
+        lead_len = pd.Series(leading).groupby(segment).transform("sum").to_numpy()
+        trail_len = pd.Series(trailing).groupby(segment).transform("sum").to_numpy()
+
+        grouped = values.groupby(segment)
+        filled = values.to_numpy(copy=True)
+        lead = flagged & leading & (lead_len <= max_gap)
+        trail = flagged & trailing & (trail_len <= max_gap)
+        filled[lead] = grouped.bfill().to_numpy()[lead]
+        filled[trail] = grouped.ffill().to_numpy()[trail]
+
+        out = np.empty(len(filled))
+        out[order] = filled
+        df[col] = out.astype(df[col].dtype, copy=False)
+    return df
+
+
+def _interpolate_outliers(df: pd.DataFrame, cols: tuple, max_gap: int = MAX_GAP_HOURS) -> pd.DataFrame:
+    # 離群值設為 NaN 後依時間線性補值（保留 is_outlier 標記）
+    # 只補 max_gap 小時內的空缺，不會把相隔很久的兩列當成相鄰來內插；
+    # 日照時段頭尾（前後是被濾掉的夜間）的離群值改用同一段內最近的有效值補，
+    # 仍補不到的（整段都是離群值、頭尾連續超過 max_gap）整列刪除，不留下全是 NaN 的列
+    cols = list(cols)
+    df = df.copy()
+    df.loc[df[OUTLIER_FLAG], cols] = np.nan
+    df = fill_columns(df, cols, max_gap=max_gap)
+    df = _fill_run_edges(df, cols, max_gap)
+    unfilled = df[OUTLIER_FLAG] & df[cols].isna().any(axis=1)
+    return df[~unfilled]
+
+
+STEP_FUNCS = {
+    "calendar": _calendar,
+    "gi_tm": _gi_tm,
+    "detect_outliers": _detect_outliers,
+    "interpolate_outliers": _interpolate_outliers,
+}
+
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    params: tuple = ()
+
+    @classmethod
+    def of(cls, name: str, **params) -> "Step":
+        if name not in STEP_FUNCS:
+            raise ValueError(f"不支援的清理步驟: {name}")
+        return cls(name, tuple(sorted(params.items())))
+
+    def digest(self, parent: str = "") -> str:
+        """上一步的 digest + 本步名稱與參數 → 整條步驟鏈的內容 hash"""
+        payload = json.dumps([parent, self.name, self.params], default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    def run(self, df: pd.DataFrame) -> pd.DataFrame:
+        return STEP_FUNCS[self.name](df, **dict(self.params))
+
+
+def cleaning_steps(
+    *,
+    apply_gi_tm: bool = True,
+    outlier_method: str = "none",
+    iqr_factor: float = 1.5,
+    z_threshold: float = DEFAULT_Z_THRESHOLD,
+    isolation_contamination: float = 0.1,
+    remove_outliers: bool = False,
+    seasonal_ratio: bool = True,
+    max_gap: int = MAX_GAP_HOURS,
+) -> list[Step]:
+    """
+    visualize 預覽與儲存共用的步驟鏈；只放會影響結果的參數
+    （例如 method=zscore 時 iqr_factor 不進 hash），同一組設定一定得到同一串 digest
+    """
+    steps = [Step.of("calendar")]
+    if apply_gi_tm:
+        steps.append(Step.of("gi_tm", max_gap=int(max_gap)))
+    if outlier_method == "none":
+        return steps
+    if outlier_method not in OUTLIER_METHODS:
+        raise ValueError(f"不支援的 outlier_method: {outlier_method}")
+
+    options = {}
+    if outlier_method.startswith("iqr"):
+        param = iqr_factor
+    elif outlier_method in ("zscore", "seasonal_robust"):
+        param = z_threshold
+    else:
+        param = isolation_contamination
+    if outlier_method == "seasonal_robust":
+        options["use_ratio"] = bool(seasonal_ratio)
+    cols = tuple(outlier_columns(outlier_method))
+    steps.append(
+        Step.of(
+            "detect_outliers",
+            method=outlier_method,
+            cols=cols,
+            param=round(float(param), 6),
+            **options,
+        )
+    )
+    if remove_outliers:
+        steps.append(Step.of("interpolate_outliers", cols=cols, max_gap=int(max_gap)))
+    return steps
+
+
+class PipelineRun:
+    """
+    對某個 dataset 版本執行步驟鏈
+    - 每一步的輸出以 (dataset_id, version, 步驟鏈 digest) 快取，跨 request 共用
+    - 同一個 run 內也會 memoize，要後面的步驟不會重算前面的
+    - 只有真的被要求的步驟才會計算（lazy）
+    """
+
+    def __init__(self, db: Session, dataset: Dataset, steps: list[Step]):
+        self.db = db
+        self.dataset = dataset
+        self.steps = list(steps)
+        self.digests = []
+        parent = ""
+        for step in self.steps:
+            parent = step.digest(parent)
+            self.digests.append(parent)
+        self._frames: dict[int, pd.DataFrame] = {}
+
+    def _key(self, i: int) -> tuple:
+        return (self.dataset.dataset_id, self.dataset.version, self.digests[i])
+
+    def source(self) -> pd.DataFrame:
+        if -1 not in self._frames:
+            # 欄式快照（memory-map），沒有才讀 DB
+            self._frames[-1] = load_dataset_frame(self.db, self.dataset).rename(
+                columns=ANALYSIS_COLUMNS
+            )
+        return self._frames[-1]
+
+    def frame(self, i: int | None = None) -> pd.DataFrame:
+        """第 i 步之後的資料（預設最後一步）；回傳值是共用的，呼叫者不可原地修改"""
+        if i is None:
+            i = len(self.steps) - 1
+        if i < 0:
+            return self.source()
+        if i in self._frames:
+            return self._frames[i]
+
+        df = pipeline_cache.get(self._key(i))
+        if df is None:
+            df = self.steps[i].run(self.frame(i - 1))
+            pipeline_cache.put(self._key(i), df)
+        self._frames[i] = df
+        return df
+
+    def after(self, name: str) -> pd.DataFrame:
+        """
+        步驟 name 之後的資料；鏈上沒有這一步（例如沒套 GI/TM）就取它之前最後一步的結果
+        步驟先後以 STEP_FUNCS 的宣告順序為準
+        """
+        order = list(STEP_FUNCS)
+        rank = order.index(name)
+        index = max(
+            (i for i, step in enumerate(self.steps) if order.index(step.name) <= rank),
+            default=-1,
+        )
+        return self.frame(index)
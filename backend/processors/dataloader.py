@@ -0,0 +1,114 @@
+# processors/dataloader.py
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, select, type_coerce
+from sqlalchemy.orm import Session
+
+from models import CleanedData, Dataset, SiteData
+
+# 分析會用到的欄位（不讀 data_id / created_at / data_name）
+SITE_COLUMNS = ("the_date", "the_hour", "gi", "tm", "eac")
+FLOAT_COLUMNS = ("gi", "tm", "eac")
+
+# 清理後資料多一個逐列的離群值標記
+CLEANED_COLUMNS = (*SITE_COLUMNS, "is_outlier")
+
+# server-side cursor 每批取回的列數
+LOAD_BATCH_ROWS = 50_000
+
+_EPOCH = date(1970, 1, 1)
+
+# 每個欄位在 NumPy 裡的型別（日期用 1970-01-01 起算的天數）
+_DTYPES = {
+    "the_date": np.int32,
+    "the_hour": np.int8,
+    "gi": np.float32,
+    "tm": np.float32,
+    "eac": np.float32,
+    "is_outlier": np.bool_,
+}
+
+
+def _select_expr(column: str, model=SiteData):
+    if column == "the_date":
+        # date - date 在 PostgreSQL 是整數天數，直接在 DB 端算好
+        return type_coerce(model.the_date - _EPOCH, Integer).label("the_date")
+    return getattr(model, column)
+
+
+def _fetch_arrays(db: Session, stmt, columns: list[str], batch_rows: int) -> dict[str, np.ndarray]:
+    parts = {c: [] for c in columns}
+    result = db.execute(stmt.execution_options(yield_per=batch_rows))
+    for rows in result.partitions():
+        for c, values in zip(columns, zip(*rows)):
+            # float 欄位的 None 會被 NumPy 轉成 NaN
+            parts[c].append(np.asarray(values, dtype=_DTYPES[c]))
+
+    return {
+        c: np.concatenate(chunks) if chunks else np.empty(0, dtype=_DTYPES[c])
+        for c, chunks in parts.items()
+    }
+
+
+def load_site_arrays(
+    db: Session,
+    dataset_id: int,
+    columns=SITE_COLUMNS,
+    *,
+    start: date | None = None,
+    end: date | None = None,
+    batch_rows: int = LOAD_BATCH_ROWS,
+) -> dict[str, np.ndarray]:
+    """
+    只 select 需要的欄位，依 (the_date, the_hour) 排序，分批串流成 NumPy 陣列
+    - the_date：int32 天數（1970-01-01 起算）
+    - the_hour：int8
+    - gi / tm / eac：float32（NULL → NaN）；gi 已乘上 dataset.gi_scale（換過單位的 dataset）
+    start / end 為日期範圍（含），分區表只會掃到對應月份
+    """
+    columns = list(columns)
+    gi_scale = select(Dataset.gi_scale).where(Dataset.dataset_id == dataset_id).scalar_subquery()
+    exprs = [
+        (SiteData.gi * gi_scale).label("gi") if c == "gi" else _select_expr(c) for c in columns
+    ]
+    stmt = (
+        select(*exprs)
+        .where(SiteData.dataset_id == dataset_id)
+        .order_by(SiteData.the_date, SiteData.the_hour)
+    )
+    if start is not None:
+        stmt = stmt.where(SiteData.the_date >= start)
+    if end is not None:
+        stmt = stmt.where(SiteData.the_date <= end)
+    return _fetch_arrays(db, stmt, columns, batch_rows)
+
+
+def load_cleaned_arrays(
+    db: Session,
+    after_id: int,
+    columns=CLEANED_COLUMNS,
+    *,
+    batch_rows: int = LOAD_BATCH_ROWS,
+) -> dict[str, np.ndarray]:
+    """cleaned_data 的版本（型別同 load_site_arrays，is_outlier 為 bool）"""
+    columns = list(columns)
+    stmt = (
+        select(*[_select_expr(c, CleanedData) for c in columns])
+        .where(CleanedData.after_id == after_id)
+        .order_by(CleanedData.the_date, CleanedData.the_hour)
+    )
+    return _fetch_arrays(db, stmt, columns, batch_rows)
+
+
+def arrays_to_frame(arrays: dict[str, np.ndarray]) -> pd.DataFrame:
+    df = pd.DataFrame(arrays, copy=False)
+    if "the_date" in df.columns:
+        df["the_date"] = pd.to_datetime(df["the_date"], unit="D")
+    return df
+
+
+def load_site_frame(db: Session, dataset_id: int, columns=SITE_COLUMNS, **kwargs) -> pd.DataFrame:
+    """load_site_arrays 的 DataFrame 版本（the_date 轉成 datetime64）"""
+    return arrays_to_frame(load_site_arrays(db, dataset_id, columns, **kwargs))
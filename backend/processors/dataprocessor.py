@@ -1,44 +1,51 @@
 # processors/dataprocessor.py
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
+
+from processors.cleaning import (
+    DEFAULT_Z_THRESHOLD,
+    iqr_mask,
+    isolation_forest_mask,
+    seasonal_robust_mask,
+    zscore_mask,
+)
+from processors.groupstats import grouped_box_stats
+from processors.hourgrid import MAX_GAP_HOURS, HourGrid
+from processors.snapshots import ANALYSIS_COLUMNS, load_cleaned_frame, load_dataset_frame
 
 class DataProcessor:
     def __init__(self):
         pass
 
+    def load_dataset(self, db, dataset):
+        # 欄式快照（memory-map），沒有才讀 DB；欄位 EAC / GI / TM / the_date / hour
+        return load_dataset_frame(db, dataset).rename(columns=ANALYSIS_COLUMNS)
+
+    def load_cleaned(self, db, after_id):
+        # /save-cleaned-data/ 存下來的結果（多一個 is_outlier 欄），不重跑清理
+        return load_cleaned_frame(db, after_id).rename(columns=ANALYSIS_COLUMNS)
+
+    def resample_hourly(self, df, columns=("EAC", "GI", "TM"), max_gap=MAX_GAP_HOURS):
+        # 訓練用的連續小時序列：缺列的小時補上（NaN），max_gap 小時內的空缺依時間內插
+        # 回傳 (每小時一列的 DataFrame，present 標記原本有沒有資料, (空缺起點, 長度))
+        grid = HourGrid.from_frame(df, [c for c in columns if c in df.columns])
+        grid = grid.interpolate(max_gap=max_gap)
+        return grid.to_frame(), grid.gaps()
+
+    # 偵測邏輯和 /visualize-data/、/save-cleaned-data/ 共用 processors.cleaning
     def detect_outliers_iqr_mask(self, df, columns, iqr_factor=1.5):
-        mask = pd.Series(False, index=df.index)
-        for col in columns:
-            if col not in df.columns: continue
-            Q1 = df[col].quantile(0.25)
-            Q3 = df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            lb = Q1 - iqr_factor * IQR
-            ub = Q3 + iqr_factor * IQR
-            mask = mask | (df[col] < lb) | (df[col] > ub)
-        return mask
-
-    def detect_outliers_zscore_mask(self, df, columns, threshold=3.0):
-        mask = pd.Series(False, index=df.index)
-        for col in columns:
-            if col not in df.columns: continue
-            std = df[col].std()
-            if std == 0 or pd.isna(std):
-                continue
-            z = (df[col] - df[col].mean()) / std
-            mask = mask | (z.abs() > threshold)
-        return mask
+        return iqr_mask(df, [c for c in columns if c in df.columns], iqr_factor)
+
+    def detect_outliers_zscore_mask(self, df, columns, threshold=DEFAULT_Z_THRESHOLD):
+        return zscore_mask(df, [c for c in columns if c in df.columns], threshold)
 
     def detect_outliers_isoforest_mask(self, df, columns, contamination=0.05):
-        numeric_data = df[columns].select_dtypes(include=[np.number]).dropna()
-        if numeric_data.shape[0] == 0:
-            return pd.Series(False, index=df.index)
-        iso = IsolationForest(contamination=contamination, random_state=42)
-        preds = pd.Series(iso.fit_predict(numeric_data), index=numeric_data.index)
-        mask = pd.Series(False, index=df.index)
-        mask.loc[preds[preds == -1].index] = True
-        return mask
+        numeric = df[columns].select_dtypes(include=[np.number]).columns
+        return isolation_forest_mask(df, list(numeric), contamination)
+
+    def detect_outliers_seasonal_mask(self, df, columns, threshold=DEFAULT_Z_THRESHOLD, use_ratio=True):
+        # 依 (month, hour) 分組的 median / MAD，需要 the_date（或 month）與 hour 欄位
+        return seasonal_robust_mask(df, [c for c in columns if c in df.columns], threshold, use_ratio)
 
     def remove_outliers(self, df, method="iqr", params=None):
         params = params or {}
@@ -49,9 +56,15 @@ class DataProcessor:
         if method == "iqr":
             mask = self.detect_outliers_iqr_mask(df, cols, iqr_factor=params.get("iqr_factor", 1.5))
         elif method == "zscore":
-            mask = self.detect_outliers_zscore_mask(df, cols, threshold=params.get("zscore_threshold", 3.0))
+            mask = self.detect_outliers_zscore_mask(df, cols, threshold=params.get("zscore_threshold", DEFAULT_Z_THRESHOLD))
         elif method == "isolation_forest":
             mask = self.detect_outliers_isoforest_mask(df, cols, contamination=params.get("contamination", 0.05))
+        elif method == "seasonal_robust":
+            mask = self.detect_outliers_seasonal_mask(
+                df, cols,
+                threshold=params.get("z_threshold", DEFAULT_Z_THRESHOLD),
+                use_ratio=params.get("use_ratio", True),
+            )
         elif method == "default":
             # default: drop NA GI, iso forest then iqr
             df2 = df.copy()
@@ -93,19 +106,17 @@ class DataProcessor:
     def compute_box_by_group(self, df, group_col, value_col):
         if not group_col or group_col not in df.columns or value_col not in df.columns:
             return {}
+        codes, labels = pd.factorize(df[group_col].fillna("NA"), sort=True)
+        stats = grouped_box_stats(
+            codes, df[value_col].to_numpy(), show_outliers=False, labels=labels
+        )
         groups = {}
-        for key, g in df.groupby(df[group_col].fillna("NA")):
-            vals = g[value_col].dropna().astype(float)
-            if len(vals) == 0:
-                groups[str(key)] = {"min": None, "q1": None, "median": None, "q3": None, "max": None}
+        for label in labels:
+            st = stats.get(str(label))
+            if st is None:
+                groups[str(label)] = {"min": None, "q1": None, "median": None, "q3": None, "max": None}
             else:
-                groups[str(key)] = {
-                    "min": float(vals.min()),
-                    "q1": float(vals.quantile(0.25)),
-                    "median": float(vals.median()),
-                    "q3": float(vals.quantile(0.75)),
-                    "max": float(vals.max()),
-                }
+                groups[str(label)] = {k: st[k] for k in ("min", "q1", "median", "q3", "max")}
         return groups
 
     def _sanitize(self, v):
@@ -0,0 +1,85 @@
+# processors/datasets.py
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import Dataset, SiteData
+from processors.moments import refresh_moments
+from processors.resultcache import pipeline_cache, visualize_cache
+
+
+def find_dataset(
+    db: Session,
+    dataset_id: int | None = None,
+    file_name: str | None = None,
+    site_id: int | None = None,
+) -> Dataset | None:
+    """
+    以 dataset_id 查 dataset；舊前端只帶 file_name 時，取該檔名最新一次「有資料」的上傳
+    （列數為 0 的 dataset 不算，例如資料全部被後來的上傳搬走）
+    有帶 site_id 就只找該案場的，不同案場上傳同檔名不會互相對到
+    """
+    if dataset_id is not None:
+        return db.query(Dataset).filter(Dataset.dataset_id == dataset_id).first()
+    if file_name:
+        query = db.query(Dataset).filter(Dataset.file_name == file_name, Dataset.row_count > 0)
+        if site_id is not None:
+            query = query.filter(Dataset.site_id == site_id)
+        return query.order_by(Dataset.uploaded_at.desc(), Dataset.dataset_id.desc()).first()
+    return None
+
+
+def first_data_id(db: Session, dataset_id: int) -> int | None:
+    """dataset 的第一筆 site_data.data_id（AfterData.data_id 仍然要指向一列）"""
+    return (
+        db.query(func.min(SiteData.data_id))
+        .filter(SiteData.dataset_id == dataset_id)
+        .scalar()
+    )
+
+
+def refresh_dataset_stats(db: Session, dataset_ids):
+    """
+    重新計算 dataset 的列數與日期範圍（走 dataset_id 索引）
+    只在資料變動後呼叫，所以順便把 version + 1，讓舊快照 / 結果快取失效，
+    並重算相關係數的充分統計量（dataset_moments）
+    """
+    dataset_ids = set(dataset_ids)
+    for dataset_id in dataset_ids:
+        visualize_cache.invalidate_dataset(dataset_id)
+        pipeline_cache.invalidate_dataset(dataset_id)
+        row_count, min_date, max_date = (
+            db.query(
+                func.count(SiteData.data_id),
+                func.min(SiteData.the_date),
+                func.max(SiteData.the_date),
+            )
+            .filter(SiteData.dataset_id == dataset_id)
+            .one()
+        )
+        db.query(Dataset).filter(Dataset.dataset_id == dataset_id).update(
+            {
+                Dataset.row_count: row_count,
+                Dataset.min_date: min_date,
+                Dataset.max_date: max_date,
+                Dataset.version: Dataset.version + 1,
+            },
+            synchronize_session=False,
+        )
+    refresh_moments(db, dataset_ids)
+
+
+def overlapping_datasets(db: Session, dataset: Dataset) -> list[int]:
+    """同案場、日期範圍重疊的其他 dataset（overwrite 會把這些 dataset 的列搬走）"""
+    if dataset.min_date is None:
+        return []
+    rows = (
+        db.query(Dataset.dataset_id)
+        .filter(
+            Dataset.site_id == dataset.site_id,
+            Dataset.dataset_id != dataset.dataset_id,
+            Dataset.min_date <= dataset.max_date,
+            Dataset.max_date >= dataset.min_date,
+        )
+        .all()
+    )
+    return [r[0] for r in rows]
@@ -0,0 +1,253 @@
+# processors/dbstats.py
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from processors.cleaning import outlier_columns
+from processors.hourgrid import MAX_GAP_HOURS
+
+# 前端欄位名稱 → site_data 欄位
+DB_COLUMNS = {"EAC": "eac", "GI": "gi", "TM": "tm"}
+
+# 箱型圖分組（和 /visualize-data/ 的 boxplot_by_* 相同）
+BOX_GROUPS = {
+    "month": "extract(month FROM the_date)::int",
+    "day": "extract(day FROM the_date)::int",
+    "hour": "the_hour",
+}
+
+# 換過單位的 dataset：GI 讀取時乘上 dataset.gi_scale
+_GI_SCALE_SQL = "(SELECT gi_scale FROM dataset WHERE dataset_id = :dataset_id)"
+
+# 原始資料（apply_gi_tm=False）
+_RAW_SOURCE_SQL = f"""
+SELECT data_id, the_date, the_hour, gi * {_GI_SCALE_SQL} AS gi, tm, eac
+FROM site_data
+WHERE dataset_id = :dataset_id
+"""
+
+# GI / TM 清理（和 processors.cleaning._gi_tm 相同）：
+# TM <= 0 視為缺值，依小時格點位置（pos = 自 1970-01-01 起的小時數）和前後最近的有效值線性內插，
+# 整段空缺（缺列 + 缺值）超過 max_gap 小時或在頭尾就不補；最後只留 GI > 0
+_GI_TM_SOURCE_SQL = """
+WITH base AS (
+    SELECT data_id, the_date, the_hour, gi * {gi_scale} AS gi, eac,
+           CASE WHEN tm > 0 THEN tm END AS tm,
+           (the_date - DATE '1970-01-01') * 24 + the_hour AS pos
+    FROM site_data
+    WHERE dataset_id = :dataset_id
+), runs AS (
+    SELECT *,
+           count(tm) OVER (ORDER BY pos) AS prev_grp,
+           count(tm) OVER (ORDER BY pos DESC) AS next_grp
+    FROM base
+), filled AS (
+    SELECT *,
+           first_value(tm) OVER (PARTITION BY prev_grp ORDER BY pos) AS prev_tm,
+           first_value(pos) OVER (PARTITION BY prev_grp ORDER BY pos) AS prev_pos,
+           first_value(tm) OVER (PARTITION BY next_grp ORDER BY pos DESC) AS next_tm,
+           first_value(pos) OVER (PARTITION BY next_grp ORDER BY pos DESC) AS next_pos
+    FROM runs
+)
+SELECT data_id, the_date, the_hour, gi, eac,
+       CASE
+           WHEN tm IS NOT NULL THEN tm
+           WHEN prev_grp = 0 OR next_grp = 0 OR next_pos - prev_pos - 1 > {max_gap} THEN NULL
+           ELSE prev_tm + (next_tm - prev_tm) * (pos - prev_pos)::float8 / (next_pos - prev_pos)
+       END AS tm
+FROM filled
+WHERE gi > 0
+"""
+
+
+# 箱型圖：資料展開成 (分組, key, eac) 後一次 GROUP BY，
+# 先算分位數 / whisker 範圍，再接回原值算 whisker 端點與離群值（iqr = 0 時退化成 median）
+_BOX_SQL = """
+WITH src AS ({source}),
+g AS (
+    SELECT k.grp, k.key, src.eac
+    FROM src
+    CROSS JOIN LATERAL (VALUES {groups}) AS k(grp, key)
+    WHERE src.eac IS NOT NULL
+), q AS (
+    SELECT grp, key, min(eac) AS vmin, max(eac) AS vmax,
+           percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY eac) AS qs
+    FROM g
+    GROUP BY grp, key
+), f AS (
+    SELECT grp, key, vmin, vmax, qs[1] AS q1, qs[2] AS median, qs[3] AS q3,
+           CASE WHEN qs[3] = qs[1] THEN qs[2] ELSE qs[1] - :whisker * (qs[3] - qs[1]) END AS lo,
+           CASE WHEN qs[3] = qs[1] THEN qs[2] ELSE qs[3] + :whisker * (qs[3] - qs[1]) END AS hi
+    FROM q
+)
+SELECT f.grp, f.key, f.vmin, f.q1, f.median, f.q3, f.vmax,
+       coalesce(min(g.eac) FILTER (WHERE g.eac BETWEEN f.lo AND f.hi), f.vmin),
+       coalesce(max(g.eac) FILTER (WHERE g.eac BETWEEN f.lo AND f.hi), f.vmax),
+       {outliers}
+FROM f
+JOIN g USING (grp, key)
+GROUP BY f.grp, f.key, f.vmin, f.q1, f.median, f.q3, f.vmax
+ORDER BY f.grp, f.key
+"""
+
+
+def source_sql(apply_gi_tm: bool, max_gap: int = MAX_GAP_HOURS) -> str:
+    """Stage 0 / Stage 1 資料列的子查詢（bind 參數 :dataset_id）"""
+    if apply_gi_tm:
+        return _GI_TM_SOURCE_SQL.format(max_gap=int(max_gap), gi_scale=_GI_SCALE_SQL)
+    return _RAW_SOURCE_SQL
+
+
+def column_stats(db: Session, dataset_id: int, *, apply_gi_tm: bool = True) -> tuple[int, dict]:
+    """
+    一句 aggregate 算出 EAC / GI / TM 的 count / mean / std / min / q1 / median / q3 / max
+    std 為樣本標準差（ddof=1，和 pandas 一致）；分位數用 percentile_cont（linear，和 pandas.quantile 一致）
+    回傳 (total_rows, {欄位: stats})
+    """
+    selects = ["count(*)"]
+    for col in DB_COLUMNS.values():
+        selects += [
+            f"count({col})",
+            f"avg({col})",
+            f"stddev_samp({col})",
+            f"min({col})",
+            f"max({col})",
+            f"percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY {col})",
+        ]
+    sql = f"WITH src AS ({source_sql(apply_gi_tm)}) SELECT {', '.join(selects)} FROM src"
+    row = db.execute(text(sql), {"dataset_id": dataset_id}).one()
+
+    total, values = row[0], row[1:]
+    stats = {}
+    for i, name in enumerate(DB_COLUMNS):
+        count, mean, std, vmin, vmax, qs = values[i * 6:(i + 1) * 6]
+        q1, median, q3 = qs if qs else (None, None, None)
+        stats[name] = {
+            "count": count,
+            "mean": mean,
+            "std": std,
+            "min": vmin,
+            "q1": q1,
+            "median": median,
+            "q3": q3,
+            "max": vmax,
+        }
+    return total, stats
+
+
+def box_stats(
+    db: Session,
+    dataset_id: int,
+    groups: tuple = tuple(BOX_GROUPS),
+    *,
+    apply_gi_tm: bool = True,
+    whisker: float = 1.5,
+    show_outliers: bool = True,
+) -> dict:
+    """
+    EAC 依 month / day / hour 分組的箱型圖統計，格式和 processors.groupstats.grouped_box_stats 相同
+    所有分組同一句 SQL，回傳 {group: {key: stats}}
+    """
+    if not groups:
+        return {}
+    values = ", ".join(f"('{g}', {BOX_GROUPS[g]})" for g in groups)
+    outliers = (
+        "array_agg(g.eac ORDER BY g.eac) FILTER (WHERE g.eac < f.lo OR g.eac > f.hi)"
+        if show_outliers
+        else "NULL::float8[]"
+    )
+    sql = _BOX_SQL.format(source=source_sql(apply_gi_tm), groups=values, outliers=outliers)
+    rows = db.execute(text(sql), {"dataset_id": dataset_id, "whisker": whisker})
+
+    result = {g: {} for g in groups}
+    for grp, key, vmin, q1, median, q3, vmax, w_min, w_max, out in rows:
+        result[grp][str(key)] = {
+            "min": vmin,
+            "q1": q1,
+            "median": median,
+            "q3": q3,
+            "max": vmax,
+            "whisker_min": w_min,
+            "whisker_max": w_max,
+            "outliers": out or [],
+        }
+    return result
+
+
+def outlier_conditions(stats: dict, method: str, cols: list[str], param: float) -> tuple[list, dict]:
+    """
+    依欄位統計組出 WHERE 條件（略過規則和 processors.cleaning.iqr_mask / zscore_mask 一致）
+    回傳 (條件字串 list, bind 參數)；NULL 比較為 false，和 pandas NaN 相同
+    """
+    conditions, params = [], {}
+    for name in cols:
+        col, s = DB_COLUMNS[name], stats[name]
+        if method.startswith("iqr"):
+            if s["count"] < 10:
+                continue
+            iqr = s["q3"] - s["q1"]
+            if iqr == 0:
+                continue
+            params[f"lo_{col}"] = s["q1"] - param * iqr
+            params[f"hi_{col}"] = s["q3"] + param * iqr
+            conditions.append(f"{col} < :lo_{col} OR {col} > :hi_{col}")
+        elif method == "zscore":
+            if not s["count"] or not s["std"]:
+                continue
+            params[f"mean_{col}"] = s["mean"]
+            params[f"std_{col}"] = s["std"]
+            conditions.append(f"abs(({col} - :mean_{col}) / :std_{col}) > :z")
+            params["z"] = param
+        else:
+            raise ValueError(f"資料庫端統計不支援 method: {method}")
+    return conditions, params
+
+
+def flagged_ids(
+    db: Session,
+    dataset_id: int,
+    stats: dict,
+    method: str,
+    param: float,
+    *,
+    apply_gi_tm: bool = True,
+) -> np.ndarray:
+    """被標記為離群值的 data_id（只回傳 id，不撈整份資料）"""
+    conditions, params = outlier_conditions(stats, method, outlier_columns(method), param)
+    if not conditions:
+        return np.empty(0, dtype=np.int64)
+    where = " OR ".join(f"({c})" for c in conditions)
+    sql = f"WITH src AS ({source_sql(apply_gi_tm)}) SELECT data_id FROM src WHERE {where} ORDER BY data_id"
+    ids = db.execute(text(sql), {"dataset_id": dataset_id, **params}).scalars().all()
+    return np.asarray(ids, dtype=np.int64)
+
+
+def summarize(
+    db: Session,
+    dataset_id: int,
+    *,
+    apply_gi_tm: bool = True,
+    method: str = "none",
+    param: float = 1.5,
+    groups: tuple = tuple(BOX_GROUPS),
+    show_outliers: bool = True,
+    include_ids: bool = True,
+) -> dict:
+    """
+    /visualize-data/summary：欄位統計 + 箱型圖 + 離群列，全部在資料庫算（不把資料列讀進 Python）
+    method：none / iqr / iqr_single / zscore；param：iqr_factor 或 z 門檻
+    """
+    total, stats = column_stats(db, dataset_id, apply_gi_tm=apply_gi_tm)
+    result = {"method": method, "total_rows": total, "columns": stats}
+
+    for group, box in box_stats(
+        db, dataset_id, groups, apply_gi_tm=apply_gi_tm, show_outliers=show_outliers
+    ).items():
+        result[f"boxplot_by_{group}"] = box
+
+    if method != "none":
+        ids = flagged_ids(db, dataset_id, stats, method, param, apply_gi_tm=apply_gi_tm)
+        result["outlier_rows"] = len(ids)
+        if include_ids:
+            result["outlier_ids"] = ids
+    return result
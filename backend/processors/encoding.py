@@ -0,0 +1,114 @@
+# processors/encoding.py
+import json
+import math
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 就用標準 json（陣列一樣整批處理）
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # 沒裝 msgpack 就只回 JSON
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+# msgpack ext type 代碼（前端依代碼還原成 TypedArray）
+EXT_FLOAT32 = 1  # little-endian float32，NaN / inf 原樣保留
+EXT_INT32 = 2  # little-endian int32
+EXT_BITMASK = 3  # 前 4 bytes 為長度（uint32 LE），之後為 packbits(bitorder="little")
+
+
+def negotiate(accept: str | None) -> str:
+    """依 Accept header 選格式：有要 msgpack 且有安裝才用，其餘一律 JSON"""
+    if msgpack is not None and accept and "msgpack" in accept:
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def encode(obj, media_type: str) -> bytes:
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return encode_msgpack(obj)
+    return encode_json(obj)
+
+
+# ===============================
+# JSON：NumPy 陣列直接序列化，NaN / inf → null
+# ===============================
+def _finite_list(a: np.ndarray) -> list:
+    """float 陣列轉 list，NaN / inf 一次 mask 成 None（不逐元素判斷）"""
+    bad = ~np.isfinite(a)
+    if not bad.any():
+        return a.tolist()
+    out = a.astype(object)
+    out[bad] = None
+    return out.tolist()
+
+
+def _jsonable(obj):
+    # 只會走到 dict / 小 list，大陣列整批轉換
+    if isinstance(obj, dict):
+        return {k: _jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_jsonable(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return _finite_list(obj) if obj.dtype.kind == "f" else obj.tolist()
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    return obj
+
+
+def _orjson_default(obj):
+    # orjson 只吃 C-contiguous 且型別支援的陣列，其餘在這裡轉
+    if isinstance(obj, np.ndarray):
+        if obj.flags.c_contiguous:
+            return _jsonable(obj)
+        return np.ascontiguousarray(obj)
+    if isinstance(obj, np.generic):
+        return _jsonable(obj)
+    raise TypeError(f"無法序列化 {type(obj).__name__}")
+
+
+def encode_json(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=_orjson_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    # 跟 FastAPI JSONResponse 相同的序列化設定
+    return json.dumps(
+        _jsonable(obj), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+# ===============================
+# msgpack：float → float32、int → int32、bool → bit-packed mask
+# ===============================
+def _msgpack_default(obj):
+    if isinstance(obj, np.ndarray):
+        if obj.ndim > 1:
+            # 矩陣拆成一列一個 ext
+            return list(obj)
+        kind = obj.dtype.kind
+        if kind == "b":
+            bits = np.packbits(obj, bitorder="little")
+            return msgpack.ExtType(EXT_BITMASK, len(obj).to_bytes(4, "little") + bits.tobytes())
+        if kind in "iu":
+            return msgpack.ExtType(EXT_INT32, obj.astype("<i4").tobytes())
+        if kind == "f":
+            return msgpack.ExtType(EXT_FLOAT32, obj.astype("<f4").tobytes())
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"無法序列化 {type(obj).__name__}")
+
+
+def encode_msgpack(obj) -> bytes:
+    return msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
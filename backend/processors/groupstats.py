@@ -0,0 +1,97 @@
+# processors/groupstats.py
+import numpy as np
+
+
+def _sorted_quantile(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """每組已排序的值取分位數（linear 內插，和 pandas.quantile 預設一致）"""
+    pos = q * (counts - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    v_lo = values[starts + lo]
+    v_hi = values[starts + hi]
+    return v_lo + (v_hi - v_lo) * (pos - lo)
+
+
+def _shortest(values: np.ndarray) -> np.ndarray:
+    """float32 算出來的值以 float32 的最短十進位表示轉回 float64（12.3 不會變成 12.300000190734863）"""
+    return np.asarray(values).astype(np.float32).astype(str).astype(float)
+
+
+def grouped_box_stats(
+    keys: np.ndarray,
+    values: np.ndarray,
+    *,
+    whisker: float = 1.5,
+    show_outliers: bool = True,
+    labels=None,
+) -> dict:
+    """
+    一次排序算出每組的箱型圖統計（min / q1 / median / q3 / max / whisker / outliers）
+    - 依 (key, value) lexsort 一次，之後全部是陣列索引，不逐組呼叫 quantile
+    - NaN 值忽略；整組都是 NaN 的 key 不會出現在結果
+    - iqr = 0 時 whisker 範圍退化成 median（跟原本前端顯示一致）
+    labels：keys 是 factorize 後的代碼時，用來還原顯示名稱
+    values 是 float32（快照欄位）時，統計值以 float32 精度輸出，不帶轉型產生的尾數
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values)
+    from_float32 = values.dtype == np.float32
+    values = values.astype(float)
+
+    valid = ~np.isnan(values)
+    keys, values = keys[valid], values[valid]
+    if len(values) == 0:
+        return {}
+
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    group_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+
+    q1 = _sorted_quantile(values, starts, counts, 0.25)
+    median = _sorted_quantile(values, starts, counts, 0.5)
+    q3 = _sorted_quantile(values, starts, counts, 0.75)
+    vmin = values[starts]
+    vmax = values[starts + counts - 1]
+
+    iqr = q3 - q1
+    lower = np.where(iqr == 0, median, q1 - whisker * iqr)
+    upper = np.where(iqr == 0, median, q3 + whisker * iqr)
+
+    # 每個值對應的組別 → 一次判斷是否落在 whisker 範圍內
+    group_of = np.repeat(np.arange(len(group_keys)), counts)
+    inside = (values >= lower[group_of]) & (values <= upper[group_of])
+
+    whisker_min = np.minimum.reduceat(np.where(inside, values, np.inf), starts)
+    whisker_max = np.maximum.reduceat(np.where(inside, values, -np.inf), starts)
+    whisker_min = np.where(np.isinf(whisker_min), vmin, whisker_min)
+    whisker_max = np.where(np.isinf(whisker_max), vmax, whisker_max)
+
+    if show_outliers:
+        out_values = values[~inside]
+        out_groups = group_of[~inside]
+        out_splits = np.split(out_values, np.searchsorted(out_groups, np.arange(1, len(group_keys))))
+    else:
+        out_splits = None
+
+    if from_float32:
+        q1, median, q3, vmin, vmax, whisker_min, whisker_max = map(
+            _shortest, (q1, median, q3, vmin, vmax, whisker_min, whisker_max)
+        )
+        if show_outliers:
+            out_splits = [_shortest(v) for v in out_splits]
+
+    result = {}
+    for i, key in enumerate(group_keys):
+        key = key.item() if hasattr(key, "item") else key
+        name = str(labels[key]) if labels is not None else str(key)
+        result[name] = {
+            "min": float(vmin[i]),
+            "q1": float(q1[i]),
+            "median": float(median[i]),
+            "q3": float(q3[i]),
+            "max": float(vmax[i]),
+            "whisker_min": float(whisker_min[i]),
+            "whisker_max": float(whisker_max[i]),
+            "outliers": out_splits[i].tolist() if show_outliers else [],
+        }
+    return result
@@ -0,0 +1,139 @@
+# processors/hourgrid.py
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# 時間內插最多補幾個小時的連續空缺（缺列 + NaN 都算），超過就維持 NaN
+MAX_GAP_HOURS = 3
+
+
+def hour_index(dates, hours) -> np.ndarray:
+    """(日期, 小時) → 自 1970-01-01 00:00 起的小時數（int64，向量化）"""
+    days = np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+    return days * 24 + np.asarray(hours, dtype=np.int64)
+
+
+def nan_runs(missing: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """bool 陣列中連續 True 的區段 → (起點, 長度)"""
+    padded = np.concatenate(([False], missing, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    return starts, ends - starts
+
+
+def interpolate_gaps(values: np.ndarray, max_gap: int = MAX_GAP_HOURS) -> np.ndarray:
+    """
+    格點上的線性內插（格點等距一小時，所以就是依時間內插）
+    只補兩側都有有效值、且整段長度 <= max_gap 的空缺；頭尾與長空缺維持 NaN
+    """
+    out = np.array(values, dtype=float)
+    valid = ~np.isnan(out)
+    xp = np.flatnonzero(valid)
+    if len(xp) < 2 or valid.all():
+        return out
+
+    starts, lengths = nan_runs(~valid)
+    fill = (starts > xp[0]) & (starts + lengths <= xp[-1]) & (lengths <= max_gap)
+    if not fill.any():
+        return out
+
+    target = np.repeat(fill, lengths)
+    positions = np.flatnonzero(~valid)[target]
+    out[positions] = np.interp(positions, xp, out[xp])
+    return out
+
+
+@dataclass
+class HourGrid:
+    """
+    dataset 的連續小時格點：第 i 格 = start 之後第 i 個小時
+    values 為 (欄位數, 小時數) 的 C-contiguous 陣列，沒有資料列的小時為 NaN；
+    rows 記錄原本每一列落在哪一格，可直接 gather 回原本的列順序（不用重新排序）
+    """
+
+    start: np.datetime64
+    columns: tuple
+    values: np.ndarray
+    present: np.ndarray
+    rows: np.ndarray
+
+    @classmethod
+    def from_frame(
+        cls, df: pd.DataFrame, columns=(), *, date_col: str = "the_date", hour_col: str = "hour"
+    ) -> "HourGrid":
+        """一次 scatter 到格點（同一小時重複時以後面的列為準）"""
+        columns = tuple(columns)
+        if df.empty:
+            return cls(
+                np.datetime64("NaT", "h"),
+                columns,
+                np.empty((len(columns), 0)),
+                np.empty(0, dtype=bool),
+                np.empty(0, dtype=np.int64),
+            )
+        index = hour_index(df[date_col].to_numpy(), df[hour_col].to_numpy())
+        first = index.min()
+        rows = index - first
+        n = int(rows.max()) + 1
+
+        values = np.full((len(columns), n), np.nan)
+        if columns:
+            values[:, rows] = df[list(columns)].to_numpy(dtype=float).T
+        present = np.zeros(n, dtype=bool)
+        present[rows] = True
+        return cls(np.datetime64(int(first), "h"), columns, values, present, rows)
+
+    def __len__(self) -> int:
+        return len(self.present)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[self.columns.index(name)]
+
+    def timestamps(self) -> np.ndarray:
+        return self.start + np.arange(len(self), dtype="timedelta64[h]")
+
+    def gaps(self) -> tuple[np.ndarray, np.ndarray]:
+        """沒有資料列的小時區段 → (起點 datetime64[h], 長度)"""
+        starts, lengths = nan_runs(~self.present)
+        return self.start + starts.astype("timedelta64[h]"), lengths
+
+    def interpolate(self, columns=None, max_gap: int = MAX_GAP_HOURS) -> "HourGrid":
+        """回傳內插後的新格點（原本的不修改，可能是快取共用的）"""
+        values = self.values.copy()
+        for name in columns or self.columns:
+            i = self.columns.index(name)
+            values[i] = interpolate_gaps(values[i], max_gap)
+        return HourGrid(self.start, self.columns, values, self.present, self.rows)
+
+    def gather(self, name: str) -> np.ndarray:
+        """格點上的值依原本的列順序取回"""
+        return self.column(name)[self.rows]
+
+    def to_frame(self) -> pd.DataFrame:
+        """整個格點展開成每小時一列（含缺列的小時；present 標記原本是否有資料）"""
+        ts = self.timestamps()
+        frame = pd.DataFrame(
+            {
+                "the_date": ts.astype("datetime64[D]").astype("datetime64[s]"),
+                "hour": (ts - ts.astype("datetime64[D]")).astype(np.int64).astype(np.int8),
+            }
+        )
+        for name in self.columns:
+            frame[name] = self.column(name)
+        frame["present"] = self.present
+        return frame
+
+
+def fill_columns(
+    df: pd.DataFrame, columns, *, max_gap: int = MAX_GAP_HOURS, date_col: str = "the_date", hour_col: str = "hour"
+) -> pd.DataFrame:
+    """df 的 columns 依時間內插後放回原本的列（列順序不變，不用事先排序）"""
+    columns = list(columns)
+    grid = HourGrid.from_frame(df, columns, date_col=date_col, hour_col=hour_col).interpolate(
+        max_gap=max_gap
+    )
+    df = df.copy()
+    for name in columns:
+        df[name] = grid.gather(name).astype(df[name].dtype, copy=False)
+    return df
@@ -0,0 +1,307 @@
+# processors/ingest.py
+import io
+from datetime import datetime
+from typing import Callable, Iterable
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Dataset
+from processors.datasets import overlapping_datasets, refresh_dataset_stats
+from processors.reader import IngestError, resolve_columns
+from processors.units import detect_irradiance_unit
+from processors.validation import ValidationReport, validate_site_frame
+
+# 系統內部欄位（已完成欄位對應 / 驗證後的 DataFrame 必須有這些欄位）
+SITE_DATA_COLUMNS = ["the_date", "the_hour", "gi", "tm", "eac"]
+
+# 每批寫入的列數上限（控制 COPY buffer / executemany 參數的記憶體）
+COPY_CHUNK_ROWS = 50_000
+
+# (site_id, the_date, the_hour) 已存在時的處理方式
+#   skip：保留舊資料 / overwrite：用新檔覆蓋 / error：整份檔案拒絕
+ON_CONFLICT_MODES = ("skip", "overwrite", "error")
+
+_STAGE_COLUMNS = ["site_id", "dataset_id", *SITE_DATA_COLUMNS, "data_name", "created_at"]
+
+# 每個 transaction 一張暫存表，COPY 先進這裡，再 INSERT ... ON CONFLICT 合併
+_CREATE_STAGE_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS site_data_stage (
+    seq        bigserial,
+    site_id    integer,
+    dataset_id integer,
+    the_date   date,
+    the_hour   integer,
+    gi         double precision,
+    tm         double precision,
+    eac        double precision,
+    data_name  varchar,
+    created_at timestamp
+) ON COMMIT DROP
+"""
+
+_MERGE_SQL = """
+WITH src AS (
+    SELECT {distinct} site_id, dataset_id, the_date, the_hour, gi, tm, eac, data_name, created_at
+    FROM site_data_stage
+    WHERE seq > :lo AND seq <= :hi
+    ORDER BY site_id, the_date, the_hour, seq
+), merged AS (
+    INSERT INTO site_data (site_id, dataset_id, the_date, the_hour, gi, tm, eac, data_name, created_at)
+    SELECT * FROM src
+    {on_conflict}
+    RETURNING data_id
+)
+-- 分區表不能 RETURNING xmax；改成數合併前已存在的 key（WITH 內的查詢都看 INSERT 之前的快照）
+SELECT
+    min(data_id),
+    count(*),
+    (SELECT count(*) FROM src JOIN site_data d USING (site_id, the_date, the_hour))
+FROM merged
+"""
+
+_ON_CONFLICT_SQL = {
+    "skip": "ON CONFLICT (site_id, the_date, the_hour) DO NOTHING",
+    "overwrite": (
+        "ON CONFLICT (site_id, the_date, the_hour) DO UPDATE SET "
+        "dataset_id = EXCLUDED.dataset_id, "
+        "gi = EXCLUDED.gi, tm = EXCLUDED.tm, eac = EXCLUDED.eac, "
+        "data_name = EXCLUDED.data_name, created_at = EXCLUDED.created_at"
+    ),
+    "error": "",
+}
+
+# 整份檔案都被 skip 時，找出擁有這些 key 的既有 dataset（取重疊最多的）
+_EXISTING_OWNER_SQL = """
+SELECT d.dataset_id
+FROM site_data_stage s
+JOIN site_data d ON d.site_id = s.site_id AND d.the_date = s.the_date AND d.the_hour = s.the_hour
+GROUP BY d.dataset_id
+ORDER BY count(*) DESC, d.dataset_id DESC
+LIMIT 1
+"""
+
+
+def _records(chunk: pd.DataFrame) -> list[dict]:
+    """DataFrame -> list[dict]，NaN 轉 None，numpy 型別轉 Python 原生型別"""
+    return chunk.astype(object).where(chunk.notna(), None).to_dict("records")
+
+
+def copy_frame(db: Session, cursor, table: str, chunk: pd.DataFrame):
+    """把一個 chunk 寫進 table：psycopg2 / psycopg 3 用 COPY，其他 driver 用 executemany"""
+    columns = ", ".join(chunk.columns)
+    sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+    if hasattr(cursor, "copy_expert") or hasattr(cursor, "copy"):
+        buf = io.StringIO()
+        # NaN 寫成空字串，COPY csv 會當作 NULL
+        chunk.to_csv(buf, header=False, index=False, na_rep="")
+        buf.seek(0)
+        if hasattr(cursor, "copy_expert"):
+            cursor.copy_expert(sql, buf)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buf.getvalue())
+    else:
+        placeholders = ", ".join(f":{c}" for c in chunk.columns)
+        db.execute(
+            text(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"),
+            _records(chunk),
+        )
+
+
+def _stage_frame(db: Session, df: pd.DataFrame, *, site_id: int, dataset_id: int, data_name: str) -> int:
+    """驗證完的 DataFrame 依序 COPY 進暫存表（只碰 temp table，不鎖 site_data），回傳列數"""
+    frame = df[SITE_DATA_COLUMNS].copy()
+    frame.insert(0, "site_id", site_id)
+    frame["dataset_id"] = dataset_id
+    frame["data_name"] = data_name
+    frame["created_at"] = datetime.utcnow()
+    frame = frame[_STAGE_COLUMNS]
+
+    # 跟 Session 共用同一條連線 / transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        copy_frame(db, cursor, "site_data_stage", frame)
+    finally:
+        cursor.close()
+    return len(frame)
+
+
+def _merge_staged(
+    db: Session,
+    on_conflict: str,
+    chunk_size: int = COPY_CHUNK_ROWS,
+    on_batch: Callable[[], None] | None = None,
+) -> dict:
+    """
+    暫存表依 seq 每 chunk_size 列一句 INSERT ... ON CONFLICT 合併進 site_data
+    這個 transaction 不建分區：合併後會持有 site_data 的鎖，再做 DDL 會和其他匯入 / 查詢互等
+    on_batch 在每批合併後呼叫（背景 job 用來更新 heartbeat）
+    """
+    counts = {"data_id": None, "inserted": 0, "updated": 0, "skipped": 0}
+    total = db.execute(text("SELECT count(*) FROM site_data_stage")).scalar()
+    merge_sql = text(
+        _MERGE_SQL.format(
+            distinct="" if on_conflict == "error" else "DISTINCT ON (site_id, the_date, the_hour)",
+            on_conflict=_ON_CONFLICT_SQL[on_conflict],
+        )
+    )
+
+    for lo in range(0, total, chunk_size):
+        try:
+            first_id, returned, existing = db.execute(
+                merge_sql, {"lo": lo, "hi": lo + chunk_size}
+            ).one()
+        except IntegrityError:
+            raise IngestError(
+                {
+                    "error": "資料重複",
+                    "message": "檔案中有 (date, hour) 已存在於此案場或在檔案內重複",
+                    "on_conflict": on_conflict,
+                }
+            )
+
+        # overwrite：已存在的 key 都被更新；skip：RETURNING 只有新增的列
+        updated = existing if on_conflict == "overwrite" else 0
+        inserted = returned - updated
+
+        if first_id is not None and (counts["data_id"] is None or first_id < counts["data_id"]):
+            counts["data_id"] = first_id
+        counts["inserted"] += inserted
+        counts["updated"] += updated
+        counts["skipped"] += min(chunk_size, total - lo) - inserted - updated
+        if on_batch:
+            on_batch()
+
+    return counts
+
+
+def ingest_frames(
+    db: Session,
+    frames: Iterable[pd.DataFrame],
+    *,
+    site_id: int,
+    data_name: str,
+    report: ValidationReport | None = None,
+    on_conflict: str = "overwrite",
+    on_progress: Callable[[str, int], None] | None = None,
+) -> dict:
+    """
+    逐塊處理上傳檔：第一塊辨識欄位，之後每塊 rename → 驗證 → 寫入，再讀下一塊
+    - 記憶體只保留一個 chunk
+    - 任一塊驗證失敗就停止寫入，但會繼續驗證剩下的 chunk 以產生完整報告
+    - 失敗時 rollback 並丟 IngestError；成功不 commit，交給呼叫端
+    - skip 模式下整份檔案都已存在時不新增 dataset，回傳的 dataset_id 是原本擁有這些資料的 dataset
+    - on_progress(phase, rows) 回報目前階段（parsing / validating / writing）與已處理列數
+    """
+    report = report or ValidationReport()
+    if on_conflict not in ON_CONFLICT_MODES:
+        raise ValueError(f"unknown on_conflict: {on_conflict}")
+    mapping = None
+    original_columns = None
+    dataset = None
+    rows = 0
+    offset = 0
+
+    def progress(phase: str):
+        if on_progress:
+            on_progress(phase, offset)
+
+    progress("parsing")
+    for chunk in frames:
+        if mapping is None:
+            original_columns = [str(c) for c in chunk.columns]
+            mapping, missing = resolve_columns(list(chunk.columns))
+            if missing:
+                raise IngestError(
+                    {
+                        "error": "欄位錯誤",
+                        "missing_required_fields": missing,
+                        "your_columns": original_columns,
+                        "example_format": [
+                            "date, hour, gi, tm, eac",
+                            "2024-01-01, 0, 0, 15.2, 0",
+                            "2024-01-01, 00:00, 0, 15.2, 0",
+                        ],
+                    }
+                )
+
+            # 欄位確認後就登記 dataset，後面每一塊都帶 dataset_id 寫入
+            dataset = Dataset(
+                site_id=site_id,
+                file_name=data_name,
+                column_mapping={internal: str(original) for original, internal in mapping.items()},
+            )
+            db.add(dataset)
+            db.flush()
+            db.execute(text(_CREATE_STAGE_SQL))
+            db.execute(text("TRUNCATE site_data_stage RESTART IDENTITY"))
+
+        progress("validating")
+        chunk = chunk[list(mapping)].rename(columns=mapping).reset_index(drop=True)
+        chunk, report = validate_site_frame(chunk, report, row_offset=offset)
+        offset += len(chunk)
+
+        if not report.ok or chunk.empty:
+            progress("parsing")
+            continue
+
+        # 先全部進暫存表，整份檔案驗證通過再一起合併
+        progress("writing")
+        rows += _stage_frame(
+            db, chunk, site_id=site_id, dataset_id=dataset.dataset_id, data_name=data_name
+        )
+        progress("parsing")
+
+    if not report.ok:
+        db.rollback()
+        raise IngestError(report.to_dict())
+    if rows == 0:
+        db.rollback()
+        raise IngestError("檔案沒有任何資料列")
+
+    # 不在匯入途中做 DDL：沒有月份分區的資料先落在 site_data_default，
+    # 由背景 job / precreate 排程的 split_default_partition 搬到月份分區
+    progress("writing")
+    written = _merge_staged(db, on_conflict, on_batch=lambda: progress("writing"))
+    data_id = written.pop("data_id")
+    counts = written
+
+    # 一列都沒寫進去（skip 且全部已存在）：不留下空的 dataset，回傳原本擁有這些資料的 dataset
+    if counts["inserted"] + counts["updated"] == 0:
+        existing_id = db.execute(text(_EXISTING_OWNER_SQL)).scalar()
+        existing = db.get(Dataset, existing_id) if existing_id is not None else None
+        if existing is not None:
+            db.delete(dataset)
+            db.flush()
+            return {
+                "rows": rows,
+                "dataset_id": existing.dataset_id,
+                "data_id": None,
+                **counts,
+                "unit": existing.unit,
+                "original_features": original_columns,
+            }
+
+    # dataset 列數 / 日期範圍；overwrite 時被搬走列的舊 dataset 也要重算
+    refresh_dataset_stats(db, [dataset.dataset_id])
+    db.refresh(dataset)
+    if counts["updated"]:
+        refresh_dataset_stats(db, overlapping_datasets(db, dataset))
+
+    # GI 單位：由分布推測並記錄在 dataset（無法判斷就維持預設 kWh/m²）
+    unit, _ = detect_irradiance_unit(db, dataset.dataset_id)
+    if unit:
+        dataset.unit = unit
+
+    return {
+        "rows": rows,
+        "dataset_id": dataset.dataset_id,
+        "data_id": data_id,
+        **counts,
+        "unit": dataset.unit,
+        "original_features": original_columns,
+    }
@@ -0,0 +1,194 @@
+# processors/jobs.py
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import BinaryIO
+
+from sqlalchemy import func, update
+
+from database import SessionLocal, engine
+from models import IngestJob
+from processors.datasets import find_dataset
+from processors.ingest import SITE_DATA_COLUMNS, ingest_frames
+from processors.partitions import split_default_partition
+from processors.reader import STREAM_CHUNK_ROWS, IngestError, iter_upload_frames
+from processors.snapshots import build_snapshot
+from processors.validation import ValidationReport
+
+# 同時最多跑幾個背景匯入
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+
+# 上傳檔暫存目錄（job 跑完就刪）
+INGEST_SPOOL_DIR = os.getenv(
+    "INGEST_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "solar_ingest")
+)
+
+# running 的 job 超過這麼久沒更新 heartbeat，視為 worker 已經不在（重啟時重新排入）
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "600"))
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+
+def spool_upload(fileobj: BinaryIO, filename: str) -> str:
+    """把上傳檔複製到本機暫存目錄，回傳路徑（保留副檔名給 parser 判斷格式）"""
+    os.makedirs(INGEST_SPOOL_DIR, exist_ok=True)
+    _, ext = os.path.splitext(filename or "")
+    path = os.path.join(INGEST_SPOOL_DIR, f"{uuid.uuid4().hex}{ext.lower()}")
+    fileobj.seek(0)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(fileobj, out, length=1024 * 1024)
+    return path
+
+
+def submit_job(job_id: int):
+    _executor.submit(run_job, job_id)
+
+
+def split_partitions():
+    """匯入時落在 site_data_default 的歷史月份搬到月份分區；只是整理，失敗記 log，下次匯入 / precreate 再做"""
+    try:
+        split_default_partition(engine)
+    except Exception:
+        logger.exception("拆分 site_data_default 失敗")
+
+
+def submit_partition_split():
+    """同步上傳 commit 後呼叫：在背景 worker 做，不佔用 request"""
+    _executor.submit(split_partitions)
+
+
+def _claim(status_db, job_id: int) -> bool:
+    """queued → running 一句 UPDATE 完成；同一個 job 被排入多次（多個 worker / process）也只有一個拿得到"""
+    now = datetime.utcnow()
+    claimed = status_db.execute(
+        update(IngestJob)
+        .where(IngestJob.job_id == job_id, IngestJob.status == "queued")
+        .values(status="running", phase="parsing", rows_processed=0, started_at=now, heartbeat_at=now)
+    ).rowcount
+    status_db.commit()
+    return claimed == 1
+
+
+def run_job(job_id: int):
+    """
+    背景執行一個匯入 job
+    - db：寫 site_data（整份檔案一個 transaction，失敗整批 rollback）
+    - status_db：更新 job 進度，每次 commit，/jobs/{id} 才看得到
+    """
+    db = SessionLocal()
+    status_db = SessionLocal()
+    job = None
+    try:
+        if not _claim(status_db, job_id):
+            return
+        job = status_db.get(IngestJob, job_id)
+
+        def on_progress(phase: str, rows: int):
+            job.phase = phase
+            job.rows_processed = rows
+            job.heartbeat_at = datetime.utcnow()
+            status_db.commit()
+
+        with open(job.spool_path, "rb") as f:
+            result = ingest_frames(
+                db,
+                iter_upload_frames(f, job.file_name, STREAM_CHUNK_ROWS),
+                site_id=job.site_id,
+                data_name=job.file_name,
+                report=ValidationReport(job.max_errors),
+                on_conflict=job.on_conflict,
+                on_progress=on_progress,
+            )
+        db.commit()
+
+        job.status = "succeeded"
+        job.rows_processed = result["rows"]
+        job.result = {
+            **result,
+            "site_id": job.site_id,
+            "file_name": job.file_name,
+            "features": SITE_DATA_COLUMNS,
+        }
+
+        # 資料已經 commit，快照只是加速用：建不起來就記 log，job 仍算成功（不然前端會重傳一份）
+        try:
+            build_snapshot(db, find_dataset(db, result["dataset_id"]))
+        except Exception:
+            db.rollback()
+            logger.exception("ingest job %s: 建立快照失敗", job_id)
+        submit_partition_split()
+    except IngestError as e:
+        db.rollback()
+        if job is not None:
+            job.status = "failed"
+            job.error = e.detail
+    except Exception as e:
+        db.rollback()
+        status_db.rollback()
+        if job is not None:
+            job.status = "failed"
+            job.error = f"匯入失敗: {e}"
+    finally:
+        if job is not None and job.status in ("succeeded", "failed"):
+            job.finished_at = datetime.utcnow()
+            status_db.commit()
+            if os.path.exists(job.spool_path):
+                os.remove(job.spool_path)
+        db.close()
+        status_db.close()
+
+
+def resume_pending_jobs():
+    """
+    服務啟動時呼叫：重新排入上次沒跑完的 job
+    - running 但 heartbeat 超過 INGEST_STALE_SECONDS 沒更新（worker 已經不在）才改回 queued，
+      其他 process 還在跑的 job 不動
+    - queued 的 job 全部排入；run_job 開始前會先認領，重複排入也只會跑一次
+    沒 commit 的匯入已經被 DB rollback，所以從頭再跑一次是安全的
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=INGEST_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(IngestJob)
+            .where(
+                IngestJob.status == "running",
+                func.coalesce(IngestJob.heartbeat_at, IngestJob.started_at, IngestJob.created_at)
+                < stale_before,
+            )
+            .values(status="queued", phase=None, rows_processed=0)
+        )
+        db.commit()
+
+        pending = (
+            db.query(IngestJob.job_id, IngestJob.spool_path)
+            .filter(IngestJob.status == "queued")
+            .order_by(IngestJob.job_id)
+            .all()
+        )
+        to_submit = []
+        for job_id, spool_path in pending:
+            if os.path.exists(spool_path):
+                to_submit.append(job_id)
+            else:
+                db.execute(
+                    update(IngestJob)
+                    .where(IngestJob.job_id == job_id, IngestJob.status == "queued")
+                    .values(
+                        status="failed",
+                        error="服務重啟時找不到暫存檔，請重新上傳",
+                        finished_at=datetime.utcnow(),
+                    )
+                )
+        db.commit()
+    finally:
+        db.close()
+
+    for job_id in to_submit:
+        submit_job(job_id)
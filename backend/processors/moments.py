@@ -0,0 +1,192 @@
+# processors/moments.py
+from dataclasses import dataclass
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import Dataset
+from processors.dbstats import source_sql
+
+# 相關係數熱圖的變數（順序即 sums / products 的順序）
+CORR_VARIABLES = ["EAC", "GI", "TM", "day", "hour", "month"]
+BASE_VARIABLES = ["EAC", "GI", "TM"]
+
+# raw：原始資料 / gi_tm：套用 GI/TM 清理後（/visualize-data/ 的 apply_gi_tm）
+MOMENT_STAGES = ("raw", "gi_tm")
+
+_EXPRESSIONS = {
+    "EAC": "eac",
+    "GI": "gi",
+    "TM": "tm",
+    "day": "extract(day FROM the_date)::float8",
+    "hour": "the_hour::float8",
+    "month": "extract(month FROM the_date)::float8",
+}
+
+# 上三角（含對角線）逐列展開，和 np.triu_indices 順序相同
+_PAIRS = list(zip(*np.triu_indices(len(CORR_VARIABLES))))
+
+
+def _aggregate_sql(stage: str) -> str:
+    """一次掃描算 n / Σx / Σxy；只算 EAC / GI / TM 都有值的列（和 dropna 後的 corr 一致）"""
+    columns = ", ".join(f"{_EXPRESSIONS[v]} AS x{i}" for i, v in enumerate(CORR_VARIABLES))
+    sums = ", ".join(f"coalesce(sum(x{i}), 0)" for i in range(len(CORR_VARIABLES)))
+    products = ", ".join(f"coalesce(sum(x{i} * x{j}), 0)" for i, j in _PAIRS)
+    return f"""
+SELECT count(*) AS n, ARRAY[{sums}] AS sums, ARRAY[{products}] AS products
+FROM (SELECT {columns} FROM ({source_sql(stage == "gi_tm")}) src) v
+WHERE x0 IS NOT NULL AND x1 IS NOT NULL AND x2 IS NOT NULL
+"""
+
+
+@dataclass
+class Moments:
+    """相關係數的充分統計量；兩份資料的統計量直接相加就是合併後的統計量"""
+
+    n: int
+    sums: np.ndarray       # (k,)
+    products: np.ndarray   # (k, k) 對稱矩陣
+
+    @classmethod
+    def empty(cls) -> "Moments":
+        k = len(CORR_VARIABLES)
+        return cls(0, np.zeros(k), np.zeros((k, k)))
+
+    @classmethod
+    def from_row(cls, n, sums, upper) -> "Moments":
+        k = len(CORR_VARIABLES)
+        products = np.zeros((k, k))
+        iu = np.triu_indices(k)
+        products[iu] = upper
+        products.T[iu] = upper
+        return cls(int(n), np.asarray(sums, dtype=float), products)
+
+    def __add__(self, other: "Moments") -> "Moments":
+        return Moments(self.n + other.n, self.sums + other.sums, self.products + other.products)
+
+    def corr(self) -> np.ndarray:
+        """Pearson 相關係數矩陣（變異數為 0 的變數整列 NaN，和 pandas 一致）"""
+        n = self.n
+        cov = (self.products - np.outer(self.sums, self.sums) / n) / (n - 1)
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = np.clip(cov / np.outer(std, std), -1.0, 1.0)
+        corr[std == 0, :] = np.nan
+        corr[:, std == 0] = np.nan
+        np.fill_diagonal(corr, np.where(std > 0, 1.0, np.nan))
+        return corr
+
+
+def aggregate_moments(db: Session, dataset_id: int, stage: str) -> Moments:
+    """直接在資料庫掃一次 dataset 算統計量（不寫入）"""
+    row = db.execute(text(_aggregate_sql(stage)), {"dataset_id": dataset_id}).one()
+    return Moments.from_row(*row)
+
+
+def refresh_moments(db: Session, dataset_ids):
+    """
+    重算並寫入 dataset_moments（上傳 / 覆蓋 / 單位換算後由 refresh_dataset_stats 呼叫）
+    version 記錄為 dataset 目前的 version；不 commit，交給呼叫端
+    """
+    for dataset_id in set(dataset_ids):
+        for stage in MOMENT_STAGES:
+            db.execute(
+                text(
+                    f"""
+                    INSERT INTO dataset_moments (dataset_id, stage, version, n, sums, products)
+                    SELECT d.dataset_id, :stage, d.version, a.n, a.sums, a.products
+                    FROM dataset d, ({_aggregate_sql(stage)}) a
+                    WHERE d.dataset_id = :dataset_id
+                    ON CONFLICT (dataset_id, stage) DO UPDATE SET
+                        version = EXCLUDED.version,
+                        n = EXCLUDED.n,
+                        sums = EXCLUDED.sums,
+                        products = EXCLUDED.products
+                    """
+                ),
+                {"dataset_id": dataset_id, "stage": stage},
+            )
+
+
+def dataset_moments(db: Session, dataset: Dataset, stage: str) -> Moments:
+    """存好的統計量（version 一致）直接用；沒有或過期就現算"""
+    row = db.execute(
+        text(
+            "SELECT n, sums, products FROM dataset_moments "
+            "WHERE dataset_id = :dataset_id AND stage = :stage AND version = :version"
+        ),
+        {"dataset_id": dataset.dataset_id, "stage": stage, "version": dataset.version},
+    ).first()
+    if row is None:
+        return aggregate_moments(db, dataset.dataset_id, stage)
+    return Moments.from_row(*row)
+
+
+def site_moments(db: Session, site_id: int, stage: str) -> Moments:
+    """案場內所有 dataset 的統計量相加（同案場同一小時只有一筆，所以等於整個案場的統計量）"""
+    rows = db.execute(
+        text(
+            "SELECT d.dataset_id, m.version = d.version AS fresh, m.n, m.sums, m.products "
+            "FROM dataset d "
+            "LEFT JOIN dataset_moments m ON m.dataset_id = d.dataset_id AND m.stage = :stage "
+            "WHERE d.site_id = :site_id"
+        ),
+        {"site_id": site_id, "stage": stage},
+    ).all()
+
+    total = Moments.empty()
+    for dataset_id, fresh, n, sums, products in rows:
+        if fresh:
+            total = total + Moments.from_row(n, sums, products)
+        else:
+            total = total + aggregate_moments(db, dataset_id, stage)
+    return total
+
+
+def correlation_heatmaps(moments: Moments) -> tuple[dict, dict]:
+    """EAC / GI / TM 與完整 6 變數的相關係數熱圖（格式和 /visualize-data/ 相同）"""
+    if moments.n < 2:
+        # 資料太少就回傳空，前端自己處理
+        return (
+            {"variables": BASE_VARIABLES, "matrix": []},
+            {"variables": CORR_VARIABLES, "matrix": []},
+        )
+    corr = moments.corr()
+    k = len(BASE_VARIABLES)
+    return (
+        {"variables": BASE_VARIABLES, "matrix": corr[:k, :k]},
+        {"variables": CORR_VARIABLES, "matrix": corr},
+    )
+
+
+def scale_moments(db: Session, dataset_id: int, variable: str, factor: float, old_version: int, new_version: int):
+    """
+    某個變數整欄乘上 factor（例如 GI 換單位）：Σx 乘 factor、Σxy 乘 factor（Σx² 乘 factor²），不用重新掃描
+    只更新 old_version 時算好的統計量，其餘的下次查詢時現算
+    """
+    scale = np.ones(len(CORR_VARIABLES))
+    scale[CORR_VARIABLES.index(variable)] = factor
+    product_scale = np.outer(scale, scale)[np.triu_indices(len(CORR_VARIABLES))]
+
+    rows = db.execute(
+        text(
+            "SELECT stage, sums, products FROM dataset_moments "
+            "WHERE dataset_id = :dataset_id AND version = :version"
+        ),
+        {"dataset_id": dataset_id, "version": old_version},
+    ).all()
+    for stage, sums, products in rows:
+        db.execute(
+            text(
+                "UPDATE dataset_moments SET sums = :sums, products = :products, version = :version "
+                "WHERE dataset_id = :dataset_id AND stage = :stage"
+            ),
+            {
+                "dataset_id": dataset_id,
+                "stage": stage,
+                "version": new_version,
+                "sums": (np.asarray(sums) * scale).tolist(),
+                "products": (np.asarray(products) * product_scale).tolist(),
+            },
+        )
@@ -0,0 +1,232 @@
+# processors/partitions.py
+import sys
+import time
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+# site_data 依月份 RANGE (the_date) 分區，分區名稱：site_data_pYYYYMM
+PARTITION_PREFIX = "site_data_p"
+
+# 建立分區時用的 advisory lock（避免兩個匯入同時建同一個分區）
+_PARTITION_LOCK_KEY = 7_310_001
+
+# 建分區要拿 site_data 的 AccessExclusive 鎖；排隊等鎖時後面的讀取也會跟著卡住，
+# 所以每次只等一下，拿不到就放開、退避後重試，全部失敗才丟錯誤
+PARTITION_LOCK_TIMEOUT = "2s"
+PARTITION_LOCK_RETRIES = 5
+_RETRY_BACKOFF_SEC = 0.5
+
+# 啟動時 / 排程預先建好當月之後幾個月的分區，一般上傳（最近的資料）就不用在匯入時做 DDL
+PARTITION_MONTHS_AHEAD = 3
+
+# lock_timeout 觸發時的 SQLSTATE（lock_not_available）
+_LOCK_NOT_AVAILABLE = "55P03"
+
+
+def _month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def is_partitioned(conn) -> bool:
+    """site_data 是否已是分區表（舊資料庫還沒跑 migrations/003 時為 False）"""
+    return bool(
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass('site_data')"
+            )
+        ).first()
+    )
+
+
+def ensure_default_partition(engine: Engine):
+    """建立 DEFAULT 分區：沒有月份分區的資料（例如上傳歷史月份）先寫在這裡，之後由 split_default_partition 搬走"""
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return
+        conn.execute(
+            text("CREATE TABLE IF NOT EXISTS site_data_default PARTITION OF site_data DEFAULT")
+        )
+
+
+def _existing_partitions(conn) -> set[str]:
+    return {
+        r[0]
+        for r in conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'site_data'::regclass"
+            )
+        )
+    }
+
+
+def _has_default(conn) -> bool:
+    return bool(conn.execute(text("SELECT to_regclass('site_data_default') IS NOT NULL")).scalar())
+
+
+def ensure_month_partitions(engine: Engine, min_date: date, max_date: date):
+    """
+    確保 [min_date, max_date] 涵蓋的每個月份都有分區
+    用獨立連線立刻 commit：建分區會鎖住 site_data，不能放在長時間的匯入 transaction 裡
+    匯入本身不呼叫這個：缺分區的月份先寫進 site_data_default，之後由 split_default_partition 搬出來
+    """
+    months = []
+    m = _month_start(min_date)
+    while m <= max_date:
+        months.append(m)
+        m = _next_month(m)
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            return
+        existing = _existing_partitions(conn)
+
+    missing = [m for m in months if partition_name(m) not in existing]
+    for m in missing:
+        _create_partition(engine, m)
+
+
+def _create_partition(engine: Engine, month: date):
+    """
+    一個月份一個短 transaction；拿不到鎖就退避重試
+    先建一般表、把 site_data_default 裡該月份的列搬進去，再 ATTACH：
+    DEFAULT 分區已有該月份資料時，直接 CREATE ... PARTITION OF 會違反 DEFAULT 分區的範圍而失敗
+    """
+    name = partition_name(month)
+    lo, hi = month.isoformat(), _next_month(month).isoformat()
+    for attempt in range(PARTITION_LOCK_RETRIES):
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _PARTITION_LOCK_KEY})
+                conn.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+                # 拿到 advisory lock 前可能已經被別的匯入 / 排程建好
+                if name in _existing_partitions(conn):
+                    return
+                conn.execute(text(f"CREATE TABLE {name} (LIKE site_data INCLUDING DEFAULTS)"))
+                if _has_default(conn):
+                    conn.execute(
+                        text(
+                            f"WITH moved AS (DELETE FROM site_data_default "
+                            f"WHERE the_date >= '{lo}' AND the_date < '{hi}' RETURNING *) "
+                            f"INSERT INTO {name} SELECT * FROM moved"
+                        )
+                    )
+                conn.execute(
+                    text(f"ALTER TABLE site_data ATTACH PARTITION {name} FOR VALUES FROM ('{lo}') TO ('{hi}')")
+                )
+            return
+        except OperationalError as e:
+            # psycopg 3：sqlstate / psycopg2：pgcode
+            code = getattr(e.orig, "sqlstate", None) or getattr(e.orig, "pgcode", None)
+            if code != _LOCK_NOT_AVAILABLE or attempt == PARTITION_LOCK_RETRIES - 1:
+                raise
+            time.sleep(_RETRY_BACKOFF_SEC * 2**attempt)
+
+
+def split_default_partition(engine: Engine) -> list[str]:
+    """
+    site_data_default 裡的資料依月份搬到各自的分區（分區不存在就建立），回傳處理過的分區名稱
+    匯入時不建歷史月份的分區（要等 site_data 的鎖，遇到長時間的查詢會讓上傳失敗），
+    資料先落在 DEFAULT 分區，由背景 job / precreate 排程呼叫這個補建
+    """
+    with engine.connect() as conn:
+        if not is_partitioned(conn) or not _has_default(conn):
+            return []
+        months = [
+            r[0]
+            for r in conn.execute(
+                text(
+                    "SELECT DISTINCT date_trunc('month', the_date)::date "
+                    "FROM site_data_default ORDER BY 1"
+                )
+            )
+        ]
+    for m in months:
+        _create_partition(engine, m)
+    return [partition_name(m) for m in months]
+
+
+def ensure_upcoming_partitions(engine: Engine, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """當月到之後 months_ahead 個月的分區（服務啟動時呼叫，也可以排程跑 precreate）"""
+    start = _month_start(date.today())
+    end = start
+    for _ in range(months_ahead):
+        end = _next_month(end)
+    ensure_month_partitions(engine, start, end)
+
+
+def drop_partitions_before(engine: Engine, cutoff: date) -> list[str]:
+    """
+    資料保存期限：整個月份都早於 cutoff 的分區直接 DETACH + DROP（不逐列 DELETE）
+    回傳被刪除的分區名稱
+    """
+    cutoff_name = partition_name(_month_start(cutoff))
+    dropped = []
+    with engine.begin() as conn:
+        names = [
+            r[0]
+            for r in conn.execute(
+                text(
+                    "SELECT c.relname FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = 'site_data'::regclass "
+                    "AND c.relname LIKE :prefix ORDER BY c.relname"
+                ),
+                {"prefix": f"{PARTITION_PREFIX}%"},
+            )
+        ]
+        for name in names:
+            # 名稱固定是 site_data_pYYYYMM，字串比較即月份先後
+            if name < cutoff_name:
+                conn.execute(text(f"ALTER TABLE site_data DETACH PARTITION {name}"))
+                conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+    return dropped
+
+
+if __name__ == "__main__":
+    # 維運用：
+    #   python -m processors.partitions expire-before 2020-01-01
+    #   python -m processors.partitions precreate [months_ahead]   （排程每月跑一次）
+    from database import SessionLocal, engine
+    from models import Dataset
+    from processors.datasets import refresh_dataset_stats
+
+    if len(sys.argv) in (2, 3) and sys.argv[1] == "precreate":
+        months_ahead = int(sys.argv[2]) if len(sys.argv) == 3 else PARTITION_MONTHS_AHEAD
+        ensure_upcoming_partitions(engine, months_ahead)
+        # 上傳時落在 DEFAULT 分區的歷史月份一併拆出來
+        for name in split_default_partition(engine):
+            print(f"split {name}")
+        sys.exit(0)
+
+    if len(sys.argv) != 3 or sys.argv[1] != "expire-before":
+        print("usage: python -m processors.partitions expire-before YYYY-MM-DD")
+        print("       python -m processors.partitions precreate [months_ahead]")
+        sys.exit(1)
+
+    cutoff = date.fromisoformat(sys.argv[2])
+    for name in drop_partitions_before(engine, cutoff):
+        print(f"dropped {name}")
+
+    # 被刪掉月份的 dataset 要重算列數 / 日期範圍
+    db = SessionLocal()
+    try:
+        ids = [r[0] for r in db.query(Dataset.dataset_id).filter(Dataset.min_date < cutoff)]
+        refresh_dataset_stats(db, ids)
+        db.commit()
+    finally:
+        db.close()
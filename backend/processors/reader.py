@@ -0,0 +1,115 @@
+# processors/reader.py
+import re
+from typing import BinaryIO, Iterator
+
+import pandas as pd
+
+# 串流模式每次讀入的列數
+STREAM_CHUNK_ROWS = 50_000
+
+# 內部欄位 -> 原始欄名要包含的關鍵字
+COLUMN_KEYWORDS = {
+    "the_date": "date",
+    "the_hour": "hour",
+    "gi": "gi",
+    "tm": "tm",
+    "eac": "eac",
+}
+
+
+class IngestError(Exception):
+    """上傳 / 匯入失敗（detail 直接給 HTTPException 或 job 結果用）"""
+
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
+
+
+# =========================
+#  欄位辨識（只看表頭，一個檔案做一次）
+# =========================
+def normalize(col) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(col).lower())
+
+
+def resolve_columns(columns: list) -> tuple[dict, list[str]]:
+    """
+    回傳 (原始欄名 -> 內部欄名 的 mapping, 缺少的欄位)
+    """
+    normalized_map = {normalize(c): c for c in columns}
+
+    def find_column(keyword: str):
+        for norm, original in normalized_map.items():
+            if keyword in norm:
+                return original
+        return None
+
+    mapping = {}
+    missing = []
+    for internal, keyword in COLUMN_KEYWORDS.items():
+        original = find_column(keyword)
+        if original is None:
+            missing.append(keyword)
+        else:
+            mapping[original] = internal
+    return mapping, missing
+
+
+# =========================
+#  檔案解析（CSV chunksize / Excel read-only iterator）
+# =========================
+def _iter_excel_rows(fileobj: BinaryIO, chunksize: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [
+            str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)
+        ]
+
+        buf = []
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            buf.append(row[: len(columns)])
+            if len(buf) >= chunksize:
+                yield pd.DataFrame(buf, columns=columns)
+                buf = []
+        if buf:
+            yield pd.DataFrame(buf, columns=columns)
+    finally:
+        wb.close()
+
+
+def _iter_frames(fileobj: BinaryIO, filename: str, chunksize: int | None):
+    name = (filename or "").lower()
+
+    if name.endswith(".csv"):
+        if chunksize:
+            yield from pd.read_csv(fileobj, chunksize=chunksize)
+        else:
+            yield pd.read_csv(fileobj)
+    elif chunksize and name.endswith((".xlsx", ".xlsm")):
+        yield from _iter_excel_rows(fileobj, chunksize)
+    else:
+        # .xls 等舊格式沒有 read-only iterator，只能整份讀
+        yield pd.read_excel(fileobj)
+
+
+def iter_upload_frames(
+    fileobj: BinaryIO, filename: str, chunksize: int | None = None
+) -> Iterator[pd.DataFrame]:
+    """
+    依副檔名逐塊讀取上傳檔（fileobj 可以是 UploadFile.file 或磁碟上的檔案）
+    chunksize=None 時整份讀成一個 DataFrame
+    """
+    try:
+        yield from _iter_frames(fileobj, filename, chunksize)
+    except IngestError:
+        raise
+    except Exception as e:
+        raise IngestError(f"檔案解析失敗: {e}")
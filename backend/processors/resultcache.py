@@ -0,0 +1,85 @@
+# processors/resultcache.py
+import os
+import threading
+from collections import OrderedDict
+
+# /visualize-data/ 回應快取的容量上限（bytes）
+VISUALIZE_CACHE_BYTES = int(os.getenv("VISUALIZE_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+# 清理流程中間結果（DataFrame）快取的容量上限（bytes）
+PIPELINE_CACHE_BYTES = int(os.getenv("PIPELINE_CACHE_BYTES", str(512 * 1024 * 1024)))
+
+# Isolation Forest 逐列 anomaly score 快取的容量上限（bytes）
+ISOFOREST_CACHE_BYTES = int(os.getenv("ISOFOREST_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+class ResultCache:
+    """
+    以 bytes 計算容量的 LRU，預設存已序列化好的回應（sizeof=len）
+    key 第一個元素必須是 dataset_id，才能整批失效
+    """
+
+    def __init__(self, max_bytes: int, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries: OrderedDict[tuple, object] = OrderedDict()
+        self._sizes: dict[tuple, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._bytes -= self._sizes.pop(key)
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                evicted, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+
+    def invalidate_dataset(self, dataset_id: int):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == dataset_id]:
+                del self._entries[key]
+                self._bytes -= self._sizes.pop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+                "evictions": self.evictions,
+            }
+
+
+def frame_nbytes(df) -> int:
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+
+visualize_cache = ResultCache(VISUALIZE_CACHE_BYTES)
+pipeline_cache = ResultCache(PIPELINE_CACHE_BYTES, sizeof=frame_nbytes)
+# key 以輸入資料內容的 hash 開頭（不是 dataset_id），資料一變 key 就不同，不需要失效
+isoforest_cache = ResultCache(ISOFOREST_CACHE_BYTES, sizeof=lambda scores: scores.nbytes)
@@ -0,0 +1,120 @@
+# processors/sampling.py
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+# full：每個點都回傳（舊前端用）/ sample：分層抽樣 / density：2D 直方圖
+SCATTER_MODES = ("full", "sample", "density")
+DEFAULT_MAX_POINTS = 2000
+DEFAULT_DENSITY_BINS = 50
+
+# 固定亂數種子：同一組參數抽出同一批點（結果快取才會一致）
+_SAMPLE_SEED = 42
+
+
+def _quota_sample(positions: np.ndarray, strata: np.ndarray, budget: int, rng) -> np.ndarray:
+    """
+    從 positions 依 strata 按比例抽剛好 budget 個
+    配額先取整數部分，剩下的名額依小數部分由大到小各補一個（最大餘數法）
+    """
+    groups, group_idx = np.unique(strata[positions], return_inverse=True)
+    group_sizes = np.bincount(group_idx, minlength=len(groups))
+    exact = group_sizes * budget / len(positions)
+    quotas = np.floor(exact).astype(int)
+    remainder = budget - int(quotas.sum())
+    quotas[np.argsort(-(exact - quotas), kind="stable")[:remainder]] += 1
+
+    # 組內隨機排名：依 (組別, 亂數) 排序後，位置 - 組起點 = 組內名次
+    priority = rng.random(len(positions))
+    order = np.lexsort((priority, group_idx))
+    starts = np.concatenate(([0], np.cumsum(group_sizes)[:-1]))
+    rank = np.arange(len(order)) - starts[group_idx[order]]
+    return positions[order[rank < quotas[group_idx[order]]]]
+
+
+def stratified_sample(
+    outlier: np.ndarray, strata: np.ndarray, max_points: int
+) -> np.ndarray:
+    """
+    回傳要保留的列位置（已排序），總數剛好 min(max_points, 列數)
+    - 離群值優先全部保留；離群值本身就超過 max_points 時，離群值也依 strata 按比例抽
+    - 剩下的名額給其餘點，依 strata（例如月份）按比例配額，每組內隨機取
+    全部是陣列運算，不逐組迴圈
+    """
+    n = len(outlier)
+    if n <= max_points:
+        return np.arange(n)
+    rng = np.random.default_rng(_SAMPLE_SEED)
+    outlier_pos = np.flatnonzero(outlier)
+    if len(outlier_pos) >= max_points:
+        return np.sort(_quota_sample(outlier_pos, strata, max_points, rng))
+
+    budget = max_points - len(outlier_pos)
+    keep_inliers = _quota_sample(np.flatnonzero(~outlier), strata, budget, rng)
+    return np.sort(np.concatenate([keep_inliers, outlier_pos]))
+
+
+def downsample_pairs(
+    df: pd.DataFrame,
+    outlier_mask: pd.Series,
+    variables: list[str],
+    *,
+    mode: str,
+    max_points: int = DEFAULT_MAX_POINTS,
+    bins: int = DEFAULT_DENSITY_BINS,
+    strata_col: str = "month",
+) -> dict:
+    """
+    散佈矩陣的精簡版本，每個無序變數組合只輸出一次（key 為 "X__Y"，反向組合 x/y 對調即可）
+    回傳值內是 NumPy 陣列，交給 processors.encoding 序列化
+    - sample：所有變數共用同一批抽樣列，離群值優先保留（最多 max_points 列）
+    - density：np.histogram2d 的格點計數 + 離群值格點計數，大小固定 bins x bins
+    """
+    outlier = outlier_mask.reindex(df.index, fill_value=False).to_numpy(dtype=bool)
+    pairs = {}
+
+    if mode == "sample":
+        strata = (
+            df[strata_col].to_numpy() if strata_col in df.columns else np.zeros(len(df))
+        )
+        keep = stratified_sample(outlier, strata, max_points)
+        sub_all = df.iloc[keep]
+        sub_outlier = outlier[keep]
+        total_outliers = int(outlier.sum())
+        for x, y in combinations(variables, 2):
+            xs = sub_all[x].to_numpy(dtype=float)
+            ys = sub_all[y].to_numpy(dtype=float)
+            valid = ~(np.isnan(xs) | np.isnan(ys))
+            pairs[f"{x}__{y}"] = {
+                "x": xs[valid],
+                "y": ys[valid],
+                "is_outlier": sub_outlier[valid],
+            }
+        return {
+            "mode": "sample",
+            "total_rows": len(df),
+            "sampled_rows": len(keep),
+            # 離群值超過 max_points 時也被抽樣，truncated = True
+            "total_outliers": total_outliers,
+            "truncated": int(sub_outlier.sum()) < total_outliers,
+            "pairs": pairs,
+        }
+
+    for x, y in combinations(variables, 2):
+        xs = df[x].to_numpy(dtype=float)
+        ys = df[y].to_numpy(dtype=float)
+        valid = ~(np.isnan(xs) | np.isnan(ys))
+        if not valid.any():
+            pairs[f"{x}__{y}"] = {"x_edges": [], "y_edges": [], "counts": [], "outlier_counts": []}
+            continue
+        xs, ys, out = xs[valid], ys[valid], outlier[valid]
+        counts, x_edges, y_edges = np.histogram2d(xs, ys, bins=bins)
+        outlier_counts, _, _ = np.histogram2d(xs[out], ys[out], bins=[x_edges, y_edges])
+        pairs[f"{x}__{y}"] = {
+            "x_edges": x_edges,
+            "y_edges": y_edges,
+            "counts": counts.astype(np.int32),
+            "outlier_counts": outlier_counts.astype(np.int32),
+        }
+    return {"mode": "density", "total_rows": len(df), "bins": bins, "pairs": pairs}
@@ -0,0 +1,129 @@
+# processors/sitestats.py
+from datetime import date, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# /site/list 可用的排序欄位 → SQL 運算式（前面加 "-" 表示遞減）
+SITE_SORT_KEYS = {
+    "created_at": "s.created_at",
+    "site_code": "s.site_code",
+    "site_name": "s.site_name",
+    "dataset_count": "dataset_count",
+    "row_count": "row_count",
+    "first_timestamp": "ds.first_date + first_hour.the_hour * interval '1 hour'",
+    "last_timestamp": "ds.last_date + last_hour.the_hour * interval '1 hour'",
+    "last_upload": "last_upload",
+    "yesterday_eac": "yesterday_eac",
+}
+DEFAULT_SITE_SORT = "-created_at"
+
+# dataset 的 row_count / min_date / max_date 上傳時就維護好了（refresh_dataset_stats），
+# 案場統計直接 GROUP BY dataset；只有頭尾小時與昨日 EAC 需要碰 site_data，
+# 各自是 (site_id, the_date, the_hour) 唯一索引上的一次小範圍查詢
+_SITE_LIST_SQL = """
+WITH ds AS (
+    SELECT site_id,
+           count(*) AS dataset_count,
+           sum(row_count) AS row_count,
+           min(min_date) AS first_date,
+           max(max_date) AS last_date,
+           max(uploaded_at) AS last_upload
+    FROM dataset
+    WHERE site_id IN (SELECT site_id FROM site WHERE user_id = :user_id)
+    GROUP BY site_id
+)
+SELECT s.site_id, s.site_code, s.site_name, s.location, s.created_at, s.user_id,
+       coalesce(ds.dataset_count, 0) AS dataset_count,
+       coalesce(ds.row_count, 0) AS row_count,
+       ds.first_date, first_hour.the_hour AS first_hour,
+       ds.last_date, last_hour.the_hour AS last_hour,
+       ds.last_upload,
+       yesterday.eac AS yesterday_eac,
+       count(*) OVER () AS total
+FROM site s
+LEFT JOIN ds ON ds.site_id = s.site_id
+LEFT JOIN LATERAL (
+    SELECT the_hour FROM site_data
+    WHERE site_id = s.site_id AND the_date = ds.first_date
+    ORDER BY the_hour LIMIT 1
+) first_hour ON true
+LEFT JOIN LATERAL (
+    SELECT the_hour FROM site_data
+    WHERE site_id = s.site_id AND the_date = ds.last_date
+    ORDER BY the_hour DESC LIMIT 1
+) last_hour ON true
+LEFT JOIN LATERAL (
+    SELECT sum(eac) AS eac FROM site_data
+    WHERE site_id = s.site_id AND the_date = :yesterday
+) yesterday ON true
+WHERE s.user_id = :user_id
+ORDER BY {order}
+LIMIT :limit OFFSET :offset
+"""
+
+
+def parse_sort(sort: str) -> str:
+    """'-row_count' → 'row_count DESC NULLS LAST, s.site_id DESC'；不支援的欄位丟 ValueError"""
+    descending = sort.startswith("-")
+    key = sort.lstrip("-")
+    if key not in SITE_SORT_KEYS:
+        raise ValueError(f"sort 只能是 {', '.join(SITE_SORT_KEYS)}（前面加 - 為遞減）")
+    direction = "DESC" if descending else "ASC"
+    # site_id 當第二排序鍵，分頁時順序才穩定
+    return f"{SITE_SORT_KEYS[key]} {direction} NULLS LAST, s.site_id {direction}"
+
+
+def _timestamp(the_date, the_hour) -> str | None:
+    if the_date is None or the_hour is None:
+        return None
+    return f"{the_date.isoformat()}T{the_hour:02d}:00:00"
+
+
+def list_sites_with_stats(
+    db: Session,
+    user_id: int,
+    *,
+    sort: str = DEFAULT_SITE_SORT,
+    limit: int | None = None,
+    offset: int = 0,
+    yesterday: date | None = None,
+) -> tuple[int, list[dict]]:
+    """
+    使用者的案場列表 + 每個案場的 dataset 數、列數、頭尾時間、最後上傳時間、昨日 EAC 總和
+    一句 SQL 算完（不是每個案場各查一次）；回傳 (案場總數, 這一頁的列)
+    """
+    yesterday = yesterday or date.today() - timedelta(days=1)
+    rows = db.execute(
+        text(_SITE_LIST_SQL.format(order=parse_sort(sort))),
+        {"user_id": user_id, "yesterday": yesterday, "limit": limit, "offset": offset},
+    ).mappings().all()
+
+    if rows:
+        total = rows[0]["total"]
+    else:
+        # offset 超過最後一頁時沒有列可以帶 total，另外數一次
+        total = db.execute(
+            text("SELECT count(*) FROM site WHERE user_id = :user_id"), {"user_id": user_id}
+        ).scalar()
+    sites = [
+        {
+            "site_id": r["site_id"],
+            "site_code": r["site_code"],
+            "site_name": r["site_name"],
+            "location": r["location"],
+            "created_at": r["created_at"].isoformat() if r["created_at"] else None,
+            "user_id": r["user_id"],
+            "stats": {
+                "dataset_count": r["dataset_count"],
+                "row_count": int(r["row_count"]),
+                "first_timestamp": _timestamp(r["first_date"], r["first_hour"]),
+                "last_timestamp": _timestamp(r["last_date"], r["last_hour"]),
+                "last_upload": r["last_upload"].isoformat() if r["last_upload"] else None,
+                "yesterday": yesterday.isoformat(),
+                "yesterday_eac": r["yesterday_eac"],
+            },
+        }
+        for r in rows
+    ]
+    return total, sites
@@ -0,0 +1,151 @@
+# processors/snapshots.py
+import glob
+import os
+import tempfile
+import uuid
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from models import Dataset
+from processors.dataloader import (
+    CLEANED_COLUMNS,
+    SITE_COLUMNS,
+    arrays_to_frame,
+    load_cleaned_arrays,
+    load_site_frame,
+)
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # 沒裝 pyarrow 就不做快照，每次都讀 DB
+    feather = None
+
+# dataset 快照（Arrow IPC / Feather v2，不壓縮才能 memory-map）
+SNAPSHOT_DIR = os.getenv(
+    "SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "solar_snapshots")
+)
+
+# 欄式快照內容跟 dataloader 一樣：只有分析欄位，float32 / int8 / 日期
+SNAPSHOT_COLUMNS = SITE_COLUMNS
+
+# 快照欄位 -> 分析用欄位名稱（跟 notebook 一致）
+ANALYSIS_COLUMNS = {"eac": "EAC", "gi": "GI", "tm": "TM", "the_hour": "hour"}
+
+
+def snapshot_path(dataset_id: int, version: int) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"dataset_{dataset_id}_v{version}.arrow")
+
+
+def cleaned_snapshot_path(after_id: int) -> str:
+    # 清理結果不會再變動，不需要 version
+    return os.path.join(SNAPSHOT_DIR, f"cleaned_{after_id}.arrow")
+
+
+def _read_arrow(path: str) -> pd.DataFrame | None:
+    if feather is None or not os.path.exists(path):
+        return None
+    try:
+        return feather.read_table(path, memory_map=True).to_pandas()
+    except (OSError, ValueError):
+        # 檔案損毀 / 被刪除：當作沒有快照
+        return None
+
+
+def _write_arrow(path: str, df: pd.DataFrame) -> bool:
+    """先寫暫存檔再 rename，讀者不會看到寫一半的檔案"""
+    if feather is None:
+        return False
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        feather.write_feather(
+            df.reset_index(drop=True), tmp, compression="uncompressed"
+        )
+        os.replace(tmp, path)
+    except OSError:
+        # 快照只是加速用，寫不進去（磁碟滿 / 權限）就下次再讀 DB
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def read_snapshot(dataset_id: int, version: int) -> pd.DataFrame | None:
+    return _read_arrow(snapshot_path(dataset_id, version))
+
+
+def write_snapshot(dataset_id: int, version: int, df: pd.DataFrame):
+    """寫入新版本快照，並清掉舊版本"""
+    path = snapshot_path(dataset_id, version)
+    if not _write_arrow(path, df):
+        return
+    _remove(
+        old
+        for old in glob.glob(os.path.join(SNAPSHOT_DIR, f"dataset_{dataset_id}_v*.arrow"))
+        if old != path
+    )
+
+
+def invalidate_snapshots(dataset_ids):
+    for dataset_id in dataset_ids:
+        _remove(glob.glob(os.path.join(SNAPSHOT_DIR, f"dataset_{dataset_id}_v*.arrow")))
+
+
+def invalidate_cleaned_snapshots(after_ids):
+    _remove(cleaned_snapshot_path(after_id) for after_id in after_ids)
+
+
+def load_dataset_frame(db: Session, dataset: Dataset) -> pd.DataFrame:
+    """
+    dataset 的原始資料（the_date / the_hour / gi / tm / eac，依時間排序）
+    - 有對應 version 的快照：memory-map 讀檔，不碰 DB
+    - 沒有：從 DB 讀一次並寫出快照
+    """
+    df = read_snapshot(dataset.dataset_id, dataset.version)
+    if df is not None:
+        return df
+
+    df = load_site_frame(db, dataset.dataset_id, SNAPSHOT_COLUMNS)
+    write_snapshot(dataset.dataset_id, dataset.version, df)
+    return df
+
+
+def build_snapshot(db: Session, dataset: Dataset):
+    """匯入 commit 後呼叫：先把快照建好，第一次分析就不用等 DB"""
+    if feather is None:
+        return
+    write_snapshot(
+        dataset.dataset_id,
+        dataset.version,
+        load_site_frame(db, dataset.dataset_id, SNAPSHOT_COLUMNS),
+    )
+
+
+def write_cleaned_snapshot(after_id: int, df: pd.DataFrame):
+    """/save-cleaned-data/ commit 後呼叫，df 為 cleaned_data 的欄位（記憶體裡已經有，不用再讀 DB）"""
+    _write_arrow(cleaned_snapshot_path(after_id), df[list(CLEANED_COLUMNS)])
+
+
+def load_cleaned_frame(db: Session, after_id: int) -> pd.DataFrame:
+    """
+    清理後資料（the_date / the_hour / gi / tm / eac / is_outlier，依時間排序）
+    - 有快照：memory-map 讀檔，完全不重算清理
+    - 沒有：從 cleaned_data 讀一次並寫出快照
+    """
+    df = _read_arrow(cleaned_snapshot_path(after_id))
+    if df is not None:
+        return df
+
+    df = arrays_to_frame(load_cleaned_arrays(db, after_id))
+    if not df.empty:
+        _write_arrow(cleaned_snapshot_path(after_id), df)
+    return df
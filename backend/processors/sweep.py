@@ -0,0 +1,106 @@
+# processors/sweep.py
+import numpy as np
+import pandas as pd
+
+from processors.cleaning import isolation_scores, seasonal_robust_z
+
+# 沒給 thresholds 時的預設格點（對應前端 slider 範圍）
+DEFAULT_GRIDS = {
+    "iqr": np.round(np.arange(0.5, 5.01, 0.1), 2),
+    "zscore": np.round(np.arange(1.0, 6.01, 0.1), 2),
+    "seasonal_robust": np.round(np.arange(1.0, 8.01, 0.1), 2),
+    "isolation_forest": np.round(np.arange(0.01, 0.501, 0.01), 2),
+}
+
+
+def _count_above(critical: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """
+    critical：每列「門檻低於多少就會被標記」的臨界值
+    門檻 t 時被標記的列數 = critical > t 的個數（排序一次 + searchsorted）
+    """
+    critical = np.sort(critical)
+    return len(critical) - np.searchsorted(critical, thresholds, side="right")
+
+
+def iqr_critical(df: pd.DataFrame, cols: list[str]) -> np.ndarray:
+    """
+    每列的 IQR 臨界倍數：x < q1 - k*iqr 或 x > q3 + k*iqr ⇔ k < max((q1-x)/iqr, (x-q3)/iqr)
+    多欄位取 max（任一欄超出就算離群），略過規則和 /visualize-data/ 一致
+    """
+    critical = np.full(len(df), -np.inf)
+    for col in cols:
+        x = df[col].to_numpy(dtype=float)
+        s = x[~np.isnan(x)]
+        if len(s) < 10:
+            continue
+        q1, q3 = np.quantile(s, [0.25, 0.75])
+        iqr = q3 - q1
+        if iqr == 0:
+            continue
+        c = np.fmax((q1 - x) / iqr, (x - q3) / iqr)
+        critical = np.fmax(critical, c)
+    return critical
+
+
+def zscore_critical(df: pd.DataFrame, cols: list[str]) -> np.ndarray:
+    """每列的 |z| 最大值（std 用 ddof=1，和 pandas 一致）"""
+    critical = np.full(len(df), -np.inf)
+    for col in cols:
+        x = df[col].to_numpy(dtype=float)
+        s = x[~np.isnan(x)]
+        if len(s) == 0:
+            continue
+        std = s.std(ddof=1) if len(s) > 1 else np.nan
+        if not std or np.isnan(std):
+            continue
+        critical = np.fmax(critical, np.abs((x - s.mean()) / std))
+    return critical
+
+
+def isolation_forest_counts(
+    df: pd.DataFrame, cols: list[str], contaminations: np.ndarray, random_state: int = 42
+) -> np.ndarray:
+    """
+    森林只訓練一次（score 和 /visualize-data/ 共用快取）：
+    fit_predict 標記 score_samples < offset_（score 的 contamination 百分位數），這裡對每個 contamination 直接查排序後的 score
+    """
+    sub = df[cols].dropna()
+    if len(sub) <= 20:
+        return np.zeros(len(contaminations), dtype=int)
+    scores = np.sort(isolation_scores(sub, random_state))
+    offsets = np.percentile(scores, 100.0 * np.asarray(contaminations))
+    return np.searchsorted(scores, offsets, side="left")
+
+
+def threshold_sweep(
+    df: pd.DataFrame,
+    method: str,
+    cols: list[str],
+    thresholds: np.ndarray,
+    *,
+    seasonal_ratio: bool = True,
+) -> dict:
+    """
+    一次算出整組門檻的離群列數與比例（method：iqr / iqr_single / zscore / isolation_forest / seasonal_robust）
+    結果和 processors.cleaning.outlier_mask 逐次計算一致
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    if method.startswith("iqr"):
+        flagged = _count_above(iqr_critical(df, cols), thresholds)
+    elif method == "zscore":
+        flagged = _count_above(zscore_critical(df, cols), thresholds)
+    elif method == "seasonal_robust":
+        flagged = _count_above(seasonal_robust_z(df, cols, seasonal_ratio), thresholds)
+    elif method == "isolation_forest":
+        flagged = isolation_forest_counts(df, cols, thresholds)
+    else:
+        raise ValueError(f"不支援的 method: {method}")
+
+    total = len(df)
+    return {
+        "method": method,
+        "total_rows": total,
+        "thresholds": thresholds,
+        "flagged": flagged.astype(np.int64),
+        "ratio": flagged / total if total else np.zeros(len(thresholds)),
+    }
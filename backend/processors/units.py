@@ -0,0 +1,89 @@
+# processors/units.py
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import Dataset
+from processors.moments import scale_moments
+from processors.resultcache import pipeline_cache, visualize_cache
+from processors.snapshots import read_snapshot, write_snapshot
+
+# 系統內部統一的日照單位
+BASE_UNIT = "kWh/m²"
+
+# 後端內建的單位換算表（跟前端邏輯一致）
+UNIT_FACTORS = {
+    "kWh/m²": 1.0,          # 已是 kWh
+    "MJ/m²": 1.0 / 3.6,     # 1 MJ/m² ≈ 0.2778 kWh/m²
+    "Wh/m²": 1.0 / 1000.0,  # 1000 Wh/m² = 1 kWh/m²
+}
+
+# 每小時 GI（> 0 的列）第 99 百分位數落在哪個範圍 → 推測單位
+# 晴天正午約 1 kWh/m² = 3.6 MJ/m² = 1000 Wh/m²；範圍之間的值無法判斷
+UNIT_RANGES = (
+    ("kWh/m²", 0.0, 1.5),
+    ("MJ/m²", 1.5, 6.0),
+    ("Wh/m²", 50.0, 2000.0),
+)
+# 有日照的列太少就不判斷
+MIN_DETECT_ROWS = 24
+
+# 讀取時的 GI = 資料列的 gi × dataset.gi_scale（倍率為正，百分位數可以最後再乘）
+_GI_PROFILE_SQL = """
+SELECT count(*),
+       percentile_cont(0.99) WITHIN GROUP (ORDER BY s.gi) * d.gi_scale,
+       max(s.gi) * d.gi_scale
+FROM site_data s
+JOIN dataset d ON d.dataset_id = s.dataset_id
+WHERE s.dataset_id = :dataset_id AND s.gi > 0
+GROUP BY d.gi_scale
+"""
+
+
+def gi_profile(db: Session, dataset_id: int) -> dict:
+    """GI 分布摘要（一句 aggregate，不讀資料列）"""
+    row = db.execute(text(_GI_PROFILE_SQL), {"dataset_id": dataset_id}).first()
+    rows, p99, vmax = row if row else (0, None, None)
+    return {"positive_rows": rows, "p99": p99, "max": vmax}
+
+
+def detect_irradiance_unit(db: Session, dataset_id: int) -> tuple[str | None, dict]:
+    """由 GI 分布推測單位；資料太少或落在範圍之間時回傳 None"""
+    profile = gi_profile(db, dataset_id)
+    if profile["positive_rows"] < MIN_DETECT_ROWS:
+        return None, profile
+    for unit, low, high in UNIT_RANGES:
+        if low < profile["p99"] <= high:
+            return unit, profile
+    return None, profile
+
+
+def convert_dataset_gi(db: Session, dataset: Dataset, from_unit: str) -> float:
+    """
+    整個 dataset 的 GI 換成 BASE_UNIT：不改寫資料列，只把倍率記在 dataset.gi_scale
+    （讀取端 dataloader / dbstats 都會乘上），dataset.unit 記錄為 BASE_UNIT、version + 1
+    - 列數 / 日期範圍不變，不用 refresh_dataset_stats 重新掃描
+    - 相關係數統計量直接乘上倍率；欄式快照由 rescale_snapshot 處理
+    回傳這次的倍率；不會 commit，交給呼叫端
+    """
+    factor = UNIT_FACTORS[from_unit]
+    old_version = dataset.version
+
+    dataset.gi_scale = dataset.gi_scale * factor
+    dataset.unit = BASE_UNIT
+    dataset.version = old_version + 1
+    db.flush()
+
+    scale_moments(db, dataset.dataset_id, "GI", factor, old_version, dataset.version)
+    visualize_cache.invalidate_dataset(dataset.dataset_id)
+    pipeline_cache.invalidate_dataset(dataset.dataset_id)
+    return factor
+
+
+def rescale_snapshot(dataset: Dataset, factor: float, old_version: int):
+    """commit 後呼叫：舊版本快照的 gi 乘上倍率存成新版本（write_snapshot 會清掉舊檔；沒有舊快照就等第一次讀取時重建）"""
+    df = read_snapshot(dataset.dataset_id, old_version)
+    if df is None:
+        return
+    df = df.copy()
+    df["gi"] = (df["gi"] * factor).astype(df["gi"].dtype)
+    write_snapshot(dataset.dataset_id, dataset.version, df)
@@ -0,0 +1,111 @@
+# processors/validation.py
+import numpy as np
+import pandas as pd
+
+# 錯誤報告最多列出幾筆（總數仍會完整計算）
+MAX_ERRORS = 200
+
+NUMERIC_COLUMNS = ["gi", "tm", "eac"]
+
+
+class ValidationReport:
+    """
+    整份檔案的驗證結果
+    - 所有檢查都是整欄向量化運算，只有前 max_errors 筆錯誤會轉成 dict
+    - 串流上傳時可以用同一個 report 累積多個 chunk（row_offset 對應原檔列號）
+    """
+
+    def __init__(self, max_errors: int = MAX_ERRORS):
+        self.max_errors = max_errors
+        self.error_count = 0
+        self.invalid_rows = 0
+        self.errors: list[dict] = []
+
+    @property
+    def ok(self) -> bool:
+        return self.error_count == 0
+
+    def add(self, column: str, reason: str, values: pd.Series, mask: np.ndarray, row_offset: int):
+        positions = np.flatnonzero(mask)
+        if len(positions) == 0:
+            return
+        self.error_count += len(positions)
+
+        room = self.max_errors - len(self.errors)
+        if room <= 0:
+            return
+        for pos in positions[:room]:
+            raw = values.iat[pos]
+            self.errors.append(
+                {
+                    "row": int(pos) + 1 + row_offset,
+                    "column": column,
+                    "value": None if pd.isna(raw) else str(raw),
+                    "reason": reason,
+                }
+            )
+
+    def to_dict(self) -> dict:
+        return {
+            "error": "資料驗證失敗",
+            "error_count": self.error_count,
+            "invalid_rows": self.invalid_rows,
+            "errors": sorted(self.errors, key=lambda e: e["row"]),
+            "truncated": self.error_count > len(self.errors),
+        }
+
+
+def parse_hour(raw: pd.Series) -> pd.Series:
+    """
+    hour 欄位整欄解析（回傳 float，無法解析為 NaN）
+    - 數字 / 數字字串：直接取整數部分
+    - "HH:MM" / "HH:MM:SS" / time 物件：取冒號前的小時
+    """
+    numeric = pd.to_numeric(raw, errors="coerce")
+    from_text = pd.to_numeric(
+        raw.astype(str).str.extract(r"^\s*(\d{1,2})\s*:", expand=False),
+        errors="coerce",
+    )
+    return np.trunc(numeric.where(numeric.notna(), from_text))
+
+
+def validate_site_frame(
+    df: pd.DataFrame,
+    report: ValidationReport | None = None,
+    *,
+    row_offset: int = 0,
+) -> tuple[pd.DataFrame, ValidationReport]:
+    """
+    驗證已 rename 成內部欄位的 DataFrame（the_date / the_hour / gi / tm / eac）
+    回傳轉型後的 DataFrame 與驗證報告；有錯誤時 DataFrame 不應寫入 DB
+    """
+    report = report or ValidationReport()
+    invalid = np.zeros(len(df), dtype=bool)
+    out = pd.DataFrame(index=df.index)
+
+    # ---------- 日期 ----------
+    dates = pd.to_datetime(df["the_date"], errors="coerce")
+    bad = dates.isna().to_numpy()
+    report.add("the_date", "日期格式錯誤 (YYYY-MM-DD)", df["the_date"], bad, row_offset)
+    invalid |= bad
+    out["the_date"] = dates.dt.date
+
+    # ---------- 小時 ----------
+    hours = parse_hour(df["the_hour"])
+    bad_format = hours.isna().to_numpy()
+    bad_range = ~bad_format & ~hours.between(0, 23).to_numpy()
+    report.add("the_hour", "hour 格式錯誤", df["the_hour"], bad_format, row_offset)
+    report.add("the_hour", "hour 必須介於 0~23", df["the_hour"], bad_range, row_offset)
+    invalid |= bad_format | bad_range
+    out["the_hour"] = hours.fillna(0).astype(int)
+
+    # ---------- 數值欄位（空值允許，非數字不行） ----------
+    for col in NUMERIC_COLUMNS:
+        values = pd.to_numeric(df[col], errors="coerce").astype(float)
+        bad = (values.isna() & df[col].notna()).to_numpy()
+        report.add(col, f"{col} 不是數字", df[col], bad, row_offset)
+        invalid |= bad
+        out[col] = values
+
+    report.invalid_rows += int(invalid.sum())
+    return out, report
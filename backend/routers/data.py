@@ -1,7 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from database import get_db
-from models import SiteData
+from database import SessionLocal, get_db
+from models import AfterData, Dataset, SiteData
+from processors.browse import (
+    CLEANED_COLUMNS,
+    DEFAULT_PAGE_ROWS,
+    MAX_PAGE_ROWS,
+    RAW_COLUMNS,
+    cleaned_rows_page,
+    iter_pages,
+    site_rows_page,
+)
+from processors.datasets import find_dataset
+from processors.encoding import encode_json
 
 router = APIRouter(
     prefix="/api/data",
@@ -23,10 +37,106 @@ def get_latest_from_db(db: Session = Depends(get_db)):
     if not latest:
         return {"rows": []}
 
-    if not latest.json_data:
-        raise HTTPException(status_code=400, detail="資料沒有 json_data")
-
-    # json_data 本來就是 list[dict]
+    # site_data 已是逐列欄位（沒有 json_data），GI 乘上所屬 dataset 的換單位倍率
+    gi_scale = (
+        db.query(Dataset.gi_scale).filter(Dataset.dataset_id == latest.dataset_id).scalar() or 1.0
+    )
     return {
-        "rows": latest.json_data[:1]  # 只拿第一列
+        "rows": [
+            {
+                "the_date": latest.the_date.isoformat(),
+                "the_hour": latest.the_hour,
+                "gi": latest.gi * gi_scale if latest.gi is not None else None,
+                "tm": latest.tm,
+                "eac": latest.eac,
+            }
+        ]
     }
+
+
+# ===============================
+# 逐列瀏覽（keyset 分頁）：cursor 為上一頁的 next_cursor，翻到多深都是同樣的查詢成本
+# stream=true 時從 cursor 開始把之後每一頁串流成 NDJSON（一行一頁）
+# ===============================
+def _parse_columns(value: str | None, allowed: tuple) -> tuple:
+    if not value:
+        return allowed
+    picked = {c.strip() for c in value.split(",") if c.strip()}
+    unknown = picked - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"columns 只能是 {', '.join(allowed)}，收到: {', '.join(sorted(unknown))}",
+        )
+    return tuple(c for c in allowed if c in picked)
+
+
+def _browse(page_func, key, columns, cursor, limit, start, end, stream, db):
+    kwargs = {"columns": columns, "limit": limit, "start": start, "end": end}
+    try:
+        if not stream:
+            return page_func(db, key, cursor=cursor, **kwargs)
+        # 先查第一頁：cursor 格式錯誤在開始串流前就回 400
+        first = page_func(db, key, cursor=cursor, **kwargs)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor 格式錯誤（YYYY-MM-DDTHH）")
+
+    # 第一頁查完就結束 request 的 transaction（dataset 物件 detach 後仍保有已載入的欄位），
+    # 下載期間不要一直持有 site_data 的鎖（會擋住建立月份分區）
+    db.close()
+
+    def page_in_own_session(*args, **kw):
+        # 每一頁一個短 Session / transaction，查完馬上把連線還回去
+        page_db = SessionLocal()
+        try:
+            return page_func(page_db, *args, **kw)
+        finally:
+            page_db.close()
+
+    def pages():
+        yield encode_json(first) + b"\n"
+        if first["next_cursor"] is None:
+            return
+        for page in iter_pages(page_in_own_session, key, cursor=first["next_cursor"], **kwargs):
+            yield encode_json(page) + b"\n"
+
+    return StreamingResponse(pages(), media_type="application/x-ndjson")
+
+
+@router.get("/datasets/{dataset_id}/rows")
+def browse_dataset_rows(
+    dataset_id: int,
+    cursor: str | None = Query(None),
+    limit: int = Query(DEFAULT_PAGE_ROWS, ge=1, le=MAX_PAGE_ROWS),
+    columns: str | None = Query(None),
+    start: date | None = Query(None),
+    end: date | None = Query(None),
+    stream: bool = Query(False),
+    db: Session = Depends(get_db),
+):
+    dataset = find_dataset(db, dataset_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="找不到資料")
+    return _browse(
+        site_rows_page, dataset, _parse_columns(columns, RAW_COLUMNS),
+        cursor, limit, start, end, stream, db,
+    )
+
+
+@router.get("/cleaned/{after_id}/rows")
+def browse_cleaned_rows(
+    after_id: int,
+    cursor: str | None = Query(None),
+    limit: int = Query(DEFAULT_PAGE_ROWS, ge=1, le=MAX_PAGE_ROWS),
+    columns: str | None = Query(None),
+    start: date | None = Query(None),
+    end: date | None = Query(None),
+    stream: bool = Query(False),
+    db: Session = Depends(get_db),
+):
+    if not db.get(AfterData, after_id):
+        raise HTTPException(status_code=404, detail="找不到清理結果")
+    return _browse(
+        cleaned_rows_page, after_id, _parse_columns(columns, CLEANED_COLUMNS),
+        cursor, limit, start, end, stream, db,
+    )
@@ -0,0 +1,44 @@
+# routers/jobs.py
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import IngestJob
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+# =========================
+#  查詢背景匯入進度
+# =========================
+@router.get("/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(IngestJob).filter(IngestJob.job_id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    elapsed = None
+    throughput = None
+    if job.started_at:
+        end = job.finished_at or datetime.utcnow()
+        elapsed = (end - job.started_at).total_seconds()
+        if elapsed > 0:
+            throughput = round(job.rows_processed / elapsed, 1)
+
+    return {
+        "job_id": job.job_id,
+        "site_id": job.site_id,
+        "file_name": job.file_name,
+        "status": job.status,
+        "phase": job.phase,
+        "rows_processed": job.rows_processed,
+        "elapsed_sec": elapsed,
+        "rows_per_sec": throughput,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
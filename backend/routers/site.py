@@ -1,26 +1,76 @@
 # routers/site.py
-from fastapi import APIRouter, UploadFile, File, Query, HTTPException, Depends
+import logging
+
+from fastapi import APIRouter, UploadFile, File, Query, HTTPException, Depends, Response
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from io import BytesIO
-import pandas as pd
-import re
 
 from database import get_db
-from models import Site, SiteData, User
+from models import Site, SiteData, User, IngestJob, Dataset, AfterData
 from schemas import CreateSite, UpdateSite
+from processors.ingest import ingest_frames
+from processors.datasets import find_dataset
+from processors.jobs import spool_upload, submit_job, submit_partition_split
+from processors.reader import STREAM_CHUNK_ROWS, IngestError, iter_upload_frames
+from processors.resultcache import pipeline_cache, visualize_cache
+from processors.sitestats import DEFAULT_SITE_SORT, list_sites_with_stats
+from processors.snapshots import (
+    build_snapshot,
+    invalidate_cleaned_snapshots,
+    invalidate_snapshots,
+)
+from processors.validation import MAX_ERRORS, ValidationReport
 
 router = APIRouter(prefix="/site", tags=["Site"])
 
+logger = logging.getLogger(__name__)
+
+# 不帶 with_stats 時只能依案場本身的欄位排序
+PLAIN_SORT_KEYS = ("created_at", "site_code", "site_name")
+
 
 # =========================
 #  案場列表
 # =========================
 @router.get("/list")
-def list_sites(user_id: int, db: Session = Depends(get_db)):
+def list_sites(
+    user_id: int,
+    response: Response,
+    with_stats: bool = Query(False),
+    sort: str = Query(DEFAULT_SITE_SORT),
+    limit: int | None = Query(None, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+):
+    """
+    with_stats=true：每個案場多帶 stats（dataset 數、列數、頭尾時間、最後上傳、昨日 EAC），一句 SQL 算完
+    sort 為欄位名稱，前面加 "-" 表示遞減；案場總數放在 X-Total-Count
+    """
+    if with_stats:
+        try:
+            total, sites = list_sites_with_stats(
+                db, user_id, sort=sort, limit=limit, offset=offset
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        response.headers["X-Total-Count"] = str(total)
+        return sites
+
+    key = sort.lstrip("-")
+    if key not in PLAIN_SORT_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不帶 with_stats 時 sort 只能是 {', '.join(PLAIN_SORT_KEYS)}",
+        )
+    column = getattr(Site, key)
+    order = column.desc() if sort.startswith("-") else column.asc()
+
+    query = db.query(Site).filter(Site.user_id == user_id)
+    response.headers["X-Total-Count"] = str(query.count())
     sites = (
-        db.query(Site)
-        .filter(Site.user_id == user_id)
-        .order_by(Site.created_at.desc())
+        query.order_by(order, Site.site_id.desc() if sort.startswith("-") else Site.site_id)
+        .offset(offset)
+        .limit(limit)
         .all()
     )
 
@@ -92,9 +142,13 @@ def create_site(payload: CreateSite, db: Session = Depends(get_db)):
 #  上傳資料（重點）
 # =========================
 @router.post("/upload-data")
-async def upload_site_data(
+def upload_site_data(
     site_id: int = Query(...),
     file: UploadFile = File(...),
+    max_errors: int = Query(MAX_ERRORS, ge=1, le=5000),
+    stream: bool = Query(False),
+    background: bool = Query(False),
+    on_conflict: str = Query("overwrite", pattern="^(skip|overwrite|error)$"),
     db: Session = Depends(get_db),
 ):
     # 1️⃣ 檢查 site 是否存在
@@ -102,142 +156,87 @@ async def upload_site_data(
     if not site:
         raise HTTPException(status_code=400, detail="site_id 不存在")
 
-    # 2️⃣ 讀檔
-    content = await file.read()
-    bio = BytesIO(content)
-
-    try:
-        if file.filename.lower().endswith(".csv"):
-            df = pd.read_csv(bio)
-        else:
-            df = pd.read_excel(bio)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"檔案解析失敗: {e}")
-
-    # =========================
-    # 3️⃣ 欄位辨識（保留原始欄位）
-    # =========================
-    original_columns = list(df.columns)  # ✅ 原始欄位（完全不動）
-
-    def normalize(col: str) -> str:
-        return re.sub(r"[^a-z0-9]", "", col.lower())
-
-    normalized_map = {normalize(c): c for c in df.columns}
-
-    def find_column(keyword: str):
-        for norm, original in normalized_map.items():
-            if keyword in norm:
-                return original
-        return None
-
-    date_col = find_column("date")
-    hour_col = find_column("hour")
-    gi_col   = find_column("gi")
-    tm_col   = find_column("tm")
-    eac_col  = find_column("eac")
-
-    missing = []
-    if not date_col: missing.append("date")
-    if not hour_col: missing.append("hour")
-    if not gi_col:   missing.append("gi")
-    if not tm_col:   missing.append("tm")
-    if not eac_col:  missing.append("eac")
-
-    if missing:
-        raise HTTPException(
-            status_code=400,
-            detail={
-                "error": "欄位錯誤",
-                "missing_required_fields": missing,
-                "your_columns": original_columns,
-                "example_format": [
-                    "date, hour, gi, tm, eac",
-                    "2024-01-01, 0, 0, 15.2, 0",
-                    "2024-01-01, 00:00, 0, 15.2, 0",
-                ],
-            },
+    # 背景模式：檔案先存到本機，立即回傳 job_id，用 /jobs/{job_id} 查進度
+    if background:
+        job = IngestJob(
+            site_id=site_id,
+            file_name=file.filename,
+            spool_path=spool_upload(file.file, file.filename),
+            max_errors=max_errors,
+            on_conflict=on_conflict,
+            status="queued",
         )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        submit_job(job.job_id)
+
+        return {
+            "message": "已排入背景處理",
+            "job_id": job.job_id,
+            "status": job.status,
+            "site_id": site_id,
+            "file_name": file.filename,
+        }
 
     # =========================
-    # 4️⃣ rename 成系統內部欄位
+    # 2️⃣ 讀檔 → 欄位辨識 → 整欄驗證 → 批次寫入
+    #    直接讀 UploadFile 的 spooled 檔，不整份 read() 進記憶體
+    #    stream=True 時逐 chunk 處理，記憶體用量與檔案大小無關
     # =========================
-    df = df.rename(
-        columns={
-            date_col: "the_date",
-            hour_col: "the_hour",
-            gi_col: "gi",
-            tm_col: "tm",
-            eac_col: "eac",
-        }
+    frames = iter_upload_frames(
+        file.file,
+        file.filename,
+        STREAM_CHUNK_ROWS if stream else None,
     )
 
-    # 5️⃣ 日期轉換
     try:
-        df["the_date"] = pd.to_datetime(df["the_date"], errors="raise").dt.date
-    except Exception:
-        raise HTTPException(
-            status_code=400,
-            detail="the_date 欄位無法轉換為日期格式 (YYYY-MM-DD)",
-        )
-
-    # =========================
-    # 6️⃣ 建立 ORM 物件（hour 安全解析）
-    # =========================
-    entries = []
-
-    for idx, row in df.iterrows():
-        raw_hour = row["the_hour"]
-
-        if isinstance(raw_hour, (int, float)):
-            hour = int(raw_hour)
-        elif isinstance(raw_hour, str):
-            try:
-                hour = int(raw_hour.split(":")[0])
-            except Exception:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"第 {idx+1} 列 hour 格式錯誤，收到: {raw_hour}",
-                )
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail=f"第 {idx+1} 列 hour 型態錯誤，收到: {raw_hour}",
-            )
-
-        if not (0 <= hour <= 23):
-            raise HTTPException(
-                status_code=400,
-                detail=f"第 {idx+1} 列 hour 必須介於 0~23，收到: {hour}",
-            )
-
-        entry = SiteData(
+        result = ingest_frames(
+            db,
+            frames,
             site_id=site_id,
-            the_date=row["the_date"],
-            the_hour=hour,
-            gi=float(row["gi"]),
-            tm=float(row["tm"]),
-            eac=float(row["eac"]),
             data_name=file.filename,
+            report=ValidationReport(max_errors),
+            on_conflict=on_conflict,
         )
-        entries.append(entry)
+    except IngestError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=e.detail)
 
-    # 7️⃣ 一次寫入
-    db.add_all(entries)
     db.commit()
-    db.refresh(entries[0])
+
+    # 匯入完成就建好欄式快照，資料清理頁第一次開啟不用再讀 DB
+    # 資料已經 commit：快照失敗只記 log，不回 500（不然前端會重傳一份）
+    try:
+        build_snapshot(db, find_dataset(db, result["dataset_id"]))
+    except Exception:
+        db.rollback()
+        logger.exception("upload %s: 建立快照失敗", result["dataset_id"])
+
+    # 歷史月份的資料先落在 DEFAULT 分區，背景補建月份分區
+    submit_partition_split()
 
     # =========================
-    # 8️⃣ 回傳（🔥 重點在這）
+    # 3️⃣ 回傳（🔥 重點在這）
     # =========================
     return {
         "message": "上傳成功",
-        "rows": len(entries),
+        "rows": result["rows"],
         "site_id": site_id,
-        "data_id": entries[0].data_id,
+        "dataset_id": result["dataset_id"],
+        "data_id": result["data_id"],
         "file_name": file.filename,
 
+        # ✅ 與既有資料合併的結果（依 on_conflict）
+        "inserted": result["inserted"],
+        "updated": result["updated"],
+        "skipped": result["skipped"],
+
+        # GI 單位（由資料分布推測，可用 /units/irradiance/convert apply 換算）
+        "unit": result["unit"],
+
         # ✅ 原始欄位（你要顯示的）
-        "original_features": original_columns,
+        "original_features": result["original_features"],
 
         # ✅ 系統實際使用欄位
         "features": ["the_date", "the_hour", "gi", "tm", "eac"],
@@ -302,8 +301,27 @@ def delete_site(site_id: int, db: Session = Depends(get_db)):
     if not site:
         raise HTTPException(status_code=404, detail="site not found")
 
+    snapshot_ids = [
+        r[0] for r in db.query(Dataset.dataset_id).filter(Dataset.site_id == site_id)
+    ]
+    dataset_ids = select(Dataset.dataset_id).where(Dataset.site_id == site_id)
+    after_ids = [
+        r[0]
+        for r in db.query(AfterData.after_id).filter(AfterData.dataset_id.in_(dataset_ids))
+    ]
+    # cleaned_data 以 ON DELETE CASCADE 跟著 after_data 刪除
+    db.query(AfterData).filter(AfterData.dataset_id.in_(dataset_ids)).delete(
+        synchronize_session=False
+    )
     db.query(SiteData).filter(SiteData.site_id == site_id).delete()
+    db.query(Dataset).filter(Dataset.site_id == site_id).delete()
+    db.query(IngestJob).filter(IngestJob.site_id == site_id).delete()
     db.delete(site)
     db.commit()
+    invalidate_snapshots(snapshot_ids)
+    invalidate_cleaned_snapshots(after_ids)
+    for dataset_id in snapshot_ids:
+        visualize_cache.invalidate_dataset(dataset_id)
+        pipeline_cache.invalidate_dataset(dataset_id)
 
     return {"message": "site deleted", "site_id": site_id}
\ No newline at end of file
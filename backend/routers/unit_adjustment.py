@@ -1,19 +1,24 @@
 # unit_adjustment.py
+import math
+import time
+
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 
 from database import get_db
 from models import SiteData
+from processors.datasets import find_dataset
+from processors.snapshots import load_cleaned_frame
+from processors.units import (
+    BASE_UNIT,
+    UNIT_FACTORS,
+    convert_dataset_gi,
+    detect_irradiance_unit,
+    rescale_snapshot,
+)
 
 router = APIRouter(tags=["UnitAdjustment"])
 
-# 後端內建的單位換算表（跟前端邏輯一致）
-UNIT_FACTORS = {
-    "kWh/m²": 1.0,          # 已是 kWh
-    "MJ/m²": 1.0 / 3.6,     # 1 MJ/m² ≈ 0.2778 kWh/m²
-    "Wh/m²": 1.0 / 1000.0,  # 1000 Wh/m² = 1 kWh/m²
-}
-
 @router.post("/units/irradiance/convert")
 def convert_irradiance_unit(payload: dict, db: Session = Depends(get_db)):
     """
@@ -21,30 +26,50 @@ def convert_irradiance_unit(payload: dict, db: Session = Depends(get_db)):
     - factor_to_kwh: 這個 from_unit 轉成 kWh/m² 要乘上的倍率
     - preview_original: 指定資料檔的第一筆 GI 數據（原始值）
     - preview_converted: 上面那個數值換算成 kWh/m² 之後的值
+    有帶 after_id 時改用清理後資料（直接讀快照，不重跑清理）
+    apply=true 時直接把整個 dataset 的 GI 換成 kWh/m²（見 apply_irradiance_unit）
     """
     from_unit = payload.get("from_unit")
+    dataset_id = payload.get("dataset_id")
     file_name = payload.get("file_name")
+    site_id = payload.get("site_id")
+    after_id = payload.get("after_id")
 
     if not from_unit:
         raise HTTPException(status_code=400, detail="缺少 from_unit")
     if from_unit not in UNIT_FACTORS:
         raise HTTPException(status_code=400, detail=f"不支援的日照單位: {from_unit}")
 
+    if payload.get("apply"):
+        if after_id is not None:
+            raise HTTPException(status_code=400, detail="清理後資料不能換算，請指定原始 dataset")
+        return apply_irradiance_unit(db, payload)
+
     factor = UNIT_FACTORS[from_unit]
 
     preview_original = None
     preview_converted = None
 
-    if file_name:
-        # 取這個檔案的第一筆資料（依日期 + 小時排序）
+    dataset = None
+    if after_id is not None:
+        # 清理後資料的第一筆（快照已依日期 + 小時排序）
+        cleaned = load_cleaned_frame(db, int(after_id))
+        if not cleaned.empty and not math.isnan(cleaned["gi"].iloc[0]):
+            preview_original = float(cleaned["gi"].iloc[0])
+            preview_converted = preview_original * factor
+    else:
+        dataset = find_dataset(db, dataset_id, file_name, site_id)
+    if dataset:
+        # 取這個 dataset 的第一筆資料（依日期 + 小時排序，走 dataset_id 索引）
         first_row = (
             db.query(SiteData)
-            .filter(SiteData.data_name == file_name)
+            .filter(SiteData.dataset_id == dataset.dataset_id)
             .order_by(SiteData.the_date, SiteData.the_hour)
             .first()
         )
         if first_row and first_row.gi is not None:
-            preview_original = float(first_row.gi)
+            # 換過單位的 dataset 讀取時要乘上 gi_scale
+            preview_original = float(first_row.gi) * dataset.gi_scale
             preview_converted = preview_original * factor
 
     return {
@@ -53,4 +78,82 @@ def convert_irradiance_unit(payload: dict, db: Session = Depends(get_db)):
         "factor_to_kwh": factor,
         "preview_original": preview_original,
         "preview_converted": preview_converted,
-    }
\ No newline at end of file
+    }
+
+def apply_irradiance_unit(db: Session, payload: dict) -> dict:
+    """
+    整個 dataset 的 GI 換算成 kWh/m²（只更新 dataset 的倍率，資料列不改寫，和列數無關）
+    - 必須帶 version（/units/irradiance/detect 會回傳）：和目前版本不同就回 409，重送同一個請求不會換算兩次
+    - 已經換算過（gi_scale 不是 1）的 dataset 也回 409
+    - 換算後 dataset.unit = kWh/m²、version + 1（快照 / 快取 / 相關係數統計量跟著更新）
+    """
+    dataset = find_dataset(
+        db, payload.get("dataset_id"), payload.get("file_name"), payload.get("site_id")
+    )
+    if not dataset:
+        raise HTTPException(status_code=404, detail="找不到資料")
+
+    expected = payload.get("version")
+    if expected is None:
+        raise HTTPException(status_code=400, detail="apply=true 時必須帶 version")
+
+    # 鎖住這個 dataset 再檢查，兩個同時送來的換算只有一個會成功
+    db.refresh(dataset, with_for_update=True)
+    if int(expected) != dataset.version:
+        raise HTTPException(
+            status_code=409,
+            detail=f"資料已變動（目前版本 {dataset.version}），請重新確認單位後再換算",
+        )
+    if dataset.gi_scale != 1.0:
+        raise HTTPException(
+            status_code=409,
+            detail=f"這份資料已換算成 {dataset.unit}（倍率 {dataset.gi_scale:g}），不能再換算一次",
+        )
+
+    from_unit = payload["from_unit"]
+    old_version = dataset.version
+    started = time.perf_counter()
+    factor = convert_dataset_gi(db, dataset, from_unit)
+    db.commit()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    rescale_snapshot(dataset, factor, old_version)
+
+    return {
+        "applied": True,
+        "dataset_id": dataset.dataset_id,
+        "from_unit": from_unit,
+        "to_unit": BASE_UNIT,
+        "factor_to_kwh": factor,
+        "gi_scale": dataset.gi_scale,
+        "rows": dataset.row_count,
+        "version": dataset.version,
+        "elapsed_ms": round(elapsed_ms, 1),
+    }
+
+
+@router.get("/units/irradiance/detect")
+def detect_irradiance(
+    dataset_id: int | None = None,
+    file_name: str | None = None,
+    site_id: int | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    由 GI 分布（> 0 的列的第 99 百分位數）推測原始單位，資料庫端一句 aggregate
+    detected_unit 為 None 表示無法判斷；recorded_unit 為 dataset 目前記錄的單位
+    version 為 /units/irradiance/convert apply=true 時要帶的版本
+    """
+    dataset = find_dataset(db, dataset_id, file_name, site_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="找不到資料")
+
+    unit, profile = detect_irradiance_unit(db, dataset.dataset_id)
+    return {
+        "dataset_id": dataset.dataset_id,
+        "detected_unit": unit,
+        "recorded_unit": dataset.unit,
+        "gi_scale": dataset.gi_scale,
+        "version": dataset.version,
+        "factor_to_kwh": UNIT_FACTORS[unit] if unit else None,
+        **profile,
+    }
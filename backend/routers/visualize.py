@@ -1,35 +1,91 @@
-from fastapi import APIRouter, Query, HTTPException, Depends
+from fastapi import APIRouter, Query, HTTPException, Depends, Header, Response
 from sqlalchemy.orm import Session
+from functools import cache
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
 
 from database import get_db
-from models import SiteData, AfterData
+from models import AfterData
+from processors.cleaned import cleaned_rows, save_cleaned_rows
+from processors.cleaning import (
+    DEFAULT_Z_THRESHOLD,
+    OUTLIER_FLAG,
+    PipelineRun,
+    cleaning_steps,
+    outlier_columns,
+)
+from processors.datasets import find_dataset, first_data_id
+from processors.dbstats import summarize
+from processors.encoding import encode, negotiate
+from processors.groupstats import grouped_box_stats
+from processors.hourgrid import HourGrid
+from processors.moments import correlation_heatmaps, dataset_moments, site_moments
+from processors.resultcache import visualize_cache
+from processors.sampling import (
+    DEFAULT_DENSITY_BINS,
+    DEFAULT_MAX_POINTS,
+    SCATTER_MODES,
+    downsample_pairs,
+)
+from processors.snapshots import write_cleaned_snapshot
+from processors.sweep import DEFAULT_GRIDS, threshold_sweep
 
 router = APIRouter(tags=["Visualize"])
 
+STAGES = ("raw", "after_gi_tm", "after_outlier")
+ALL_SECTIONS = ("scatter", "hist", "box_month", "box_day", "box_hour", "corr")
+BOX_SECTIONS = {"box_month": "month", "box_day": "day", "box_hour": "hour"}
+
 
 # ===============================
-# JSON 安全處理
+# 結果快取 key：dataset 版本 + 正規化後的參數
+# （只放會影響結果的參數，例如 method=zscore 時 iqr_factor 不算）
 # ===============================
-def safe_json(obj):
-    if isinstance(obj, dict):
-        return {k: safe_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [safe_json(v) for v in obj]
-    elif isinstance(obj, (np.integer, np.floating)):
-        v = obj.item()
-        if isinstance(v, float) and (np.isnan(v) or np.isinf(v)):
-            return None
-        return v
-    elif isinstance(obj, float):
-        return None if np.isnan(obj) or np.isinf(obj) else obj
-    return obj
+def visualize_cache_key(
+    dataset,
+    *,
+    apply_gi_tm: bool,
+    outlier_method: str,
+    iqr_factor: float,
+    z_threshold: float,
+    isolation_contamination: float,
+    remove_outliers: bool,
+    scatter_mode: str = "full",
+    max_points: int = DEFAULT_MAX_POINTS,
+    density_bins: int = DEFAULT_DENSITY_BINS,
+    stages: tuple = STAGES,
+    sections: tuple = ALL_SECTIONS,
+    seasonal_ratio: bool = True,
+) -> tuple:
+    if outlier_method.startswith("iqr"):
+        param = round(iqr_factor, 6)
+    elif outlier_method == "zscore":
+        param = round(z_threshold, 6)
+    elif outlier_method == "seasonal_robust":
+        param = (round(z_threshold, 6), bool(seasonal_ratio))
+    elif outlier_method == "isolation_forest":
+        param = round(isolation_contamination, 6)
+    else:
+        param = None
+
+    return (
+        dataset.dataset_id,
+        dataset.version,
+        bool(apply_gi_tm),
+        outlier_method,
+        param,
+        bool(remove_outliers),
+        scatter_mode,
+        max_points if scatter_mode == "sample" else None,
+        density_bins if scatter_mode == "density" else None,
+        stages,
+        sections,
+    )
 
 
 # ===============================
 # 圖表資料產生器（不再計算 correlation）
+# sections 只算有要的圖，預設全部
 # ===============================
 def build_plots(
     df: pd.DataFrame,
@@ -38,96 +94,104 @@ def build_plots(
     remove_outliers: bool = False,
     correlation_heatmap: dict | None = None,
     correlation_heatmap_full: dict | None = None,
+    scatter_mode: str = "full",
+    max_points: int = DEFAULT_MAX_POINTS,
+    density_bins: int = DEFAULT_DENSITY_BINS,
+    sections: tuple = ALL_SECTIONS,
 ):
     if outlier_mask is None:
         outlier_mask = pd.Series(False, index=df.index)
     outlier_mask = outlier_mask.reindex(df.index, fill_value=False)
 
     variables = ["EAC", "GI", "TM"]
-    hist = {}
+    result = {}
 
     # ---------- Histogram ----------
-    for v in variables:
-        s = df[v].dropna()
-        if len(s) < 5:
-            hist[v] = {"bins": [], "counts": []}
-            continue
-        counts, bins = np.histogram(s, bins=10)
-        hist[v] = {
-            "bins": bins.tolist(),
-            "counts": counts.tolist(),
-        }
+    hist = {}
+    if "hist" in sections:
+        for v in variables:
+            s = df[v].dropna()
+            if len(s) < 5:
+                hist[v] = {"bins": [], "counts": []}
+                continue
+            counts, bins = np.histogram(s, bins=10)
+            hist[v] = {"bins": bins, "counts": counts}
 
     # ---------- Scatter ----------
+    # sample / density：payload 大小固定，每個無序組合只輸出一次
+    # 直接放 NumPy 陣列，由 encoder 序列化（不 tolist）
+    scatter_extra = {}
     pairs = {}
-    for x in variables:
-        for y in variables:
-            if x == y:
-                continue
-            sub = df[[x, y]].dropna()
-            pairs[f"{x}__{y}"] = {
-                "x": sub[x].tolist(),
-                "y": sub[y].tolist(),
-                "is_outlier": outlier_mask.loc[sub.index].tolist(),
-            }
+    if "scatter" in sections:
+        if scatter_mode == "full":
+            values = {v: df[v].to_numpy() for v in variables}
+            is_outlier = outlier_mask.to_numpy(dtype=bool)
+            for x in variables:
+                for y in variables:
+                    if x == y:
+                        continue
+                    valid = ~(np.isnan(values[x]) | np.isnan(values[y]))
+                    pairs[f"{x}__{y}"] = {
+                        "x": values[x][valid],
+                        "y": values[y][valid],
+                        "is_outlier": is_outlier[valid],
+                    }
+        else:
+            scatter_extra = downsample_pairs(
+                df,
+                outlier_mask,
+                variables,
+                mode=scatter_mode,
+                max_points=max_points,
+                bins=density_bins,
+            )
+            pairs = scatter_extra.pop("pairs")
+
+    if "scatter" in sections or "hist" in sections:
+        result["scatter_matrix"] = {
+            "variables": variables,
+            "pairs": pairs,
+            "hist": hist,
+            **scatter_extra,
+        }
 
     # ---------- Boxplot ----------
+    # 一次排序算完所有組別（不逐組 quantile）
     def build_box(group_col: str, show_outliers: bool = True):
-        result = {}
-        for g, sub in df.groupby(group_col):
-            v = sub["EAC"].dropna()
-
-            # 沒資料才跳過
-            if len(v) == 0:
-                continue
-
-            q1 = v.quantile(0.25)
-            q3 = v.quantile(0.75)
-            iqr = q3 - q1
-
-            # 避免 iqr = 0 時 whisker = NaN
-            if iqr == 0:
-                lower = upper = v.median()
-            else:
-                lower = q1 - 1.5 * iqr
-                upper = q3 + 1.5 * iqr
-
-            inside = v[(v >= lower) & (v <= upper)]
-            whisker_min = inside.min() if not inside.empty else v.min()
-            whisker_max = inside.max() if not inside.empty else v.max()
-
-            outliers = v[(v < lower) | (v > upper)].tolist()
-
-            result[str(g)] = {
-                "min": float(v.min()),
-                "q1": float(q1),
-                "median": float(v.median()),
-                "q3": float(q3),
-                "max": float(v.max()),
-                "whisker_min": float(whisker_min),
-                "whisker_max": float(whisker_max),
-                "outliers": outliers if show_outliers else [],
-            }
-        return result
-
+        return grouped_box_stats(
+            df[group_col].to_numpy(),
+            df["EAC"].to_numpy(),
+            show_outliers=show_outliers,
+        )
 
     show_outliers = not remove_outliers
 
-    return {
-        "scatter_matrix": {
-            "variables": variables,
-            "pairs": pairs,
-            "hist": hist,
-        },
-        "boxplot_by_month": build_box("month", show_outliers=show_outliers),
-        "boxplot_by_day": build_box("day", show_outliers=show_outliers),
-        "boxplot_by_hour": build_box("hour", show_outliers=show_outliers),
-        "boxplot_by_batch": {},
-
-        # 這兩個直接用呼叫者算好的結果
-        "correlation_heatmap": correlation_heatmap,
-        "correlation_heatmap_full": correlation_heatmap_full,
-    }
+    for section, group_col in BOX_SECTIONS.items():
+        if section in sections:
+            result[f"boxplot_by_{group_col}"] = build_box(group_col, show_outliers=show_outliers)
+    if any(section in sections for section in BOX_SECTIONS):
+        result["boxplot_by_batch"] = {}
+
+    # 這兩個直接用呼叫者算好的結果
+    if "corr" in sections:
+        result["correlation_heatmap"] = correlation_heatmap
+        result["correlation_heatmap_full"] = correlation_heatmap_full
+
+    return result
+
+
+def parse_selector(value: str | None, allowed: tuple, name: str) -> tuple:
+    """逗號分隔的選擇器（stages= / sections=），回傳依 allowed 順序排好的 tuple"""
+    if not value:
+        return allowed
+    picked = {v.strip() for v in value.split(",") if v.strip()}
+    unknown = picked - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{name} 只能是 {', '.join(allowed)}，收到: {', '.join(sorted(unknown))}",
+        )
+    return tuple(v for v in allowed if v in picked)
 
 
 # ===============================
@@ -135,287 +199,427 @@ def build_plots(
 # ===============================
 @router.get("/visualize-data/")
 def visualize_data(
-    file_name: str = Query(...),
+    dataset_id: int | None = Query(None),
+    file_name: str | None = Query(None),
+    site_id: int | None = Query(None),
     apply_gi_tm: bool = Query(True),
     outlier_method: str = Query("none"),
     iqr_factor: float = Query(1.5),
-    z_threshold: float = Query(3.0),
+    z_threshold: float = Query(DEFAULT_Z_THRESHOLD),
     isolation_contamination: float = Query(0.1),
     remove_outliers: bool = Query(False),
+    seasonal_ratio: bool = Query(True),
+    scatter_mode: str = Query("full", pattern=f"^({'|'.join(SCATTER_MODES)})$"),
+    max_points: int = Query(DEFAULT_MAX_POINTS, ge=100, le=200_000),
+    density_bins: int = Query(DEFAULT_DENSITY_BINS, ge=5, le=200),
+    stages: str | None = Query(None),
+    sections: str | None = Query(None),
+    accept: str | None = Header(None),
     db: Session = Depends(get_db),
 ):
-    # ---------- 撈資料 ----------
-    entries = (
-        db.query(SiteData)
-        .filter(SiteData.data_name == file_name)
-        .order_by(SiteData.the_date, SiteData.the_hour)
-        .all()
-    )
-    if not entries:
+    # 只計算有要的 stage / 圖表（逗號分隔，預設全部）
+    stages = parse_selector(stages, STAGES, "stages")
+    sections = parse_selector(sections, ALL_SECTIONS, "sections")
+    # Accept: application/x-msgpack → 二進位（float32 陣列 + bit-packed mask）
+    media_type = negotiate(accept)
+
+    # ---------- 撈資料（dataset_id 索引；舊前端只帶 file_name） ----------
+    dataset = find_dataset(db, dataset_id, file_name, site_id)
+    if not dataset:
         raise HTTPException(status_code=404, detail="找不到資料")
 
-    # ---------- correlation 專用：完全原始 df_corr_doc ----------
-    df_corr_doc = pd.DataFrame(
-        [
-            {
-                "EAC": e.eac,
-                "GI": e.gi,
-                "TM": e.tm,
-                "the_date": e.the_date,
-                "hour": e.the_hour,
-            }
-            for e in entries
-        ]
-    )
-    df_corr_doc["the_date"] = pd.to_datetime(df_corr_doc["the_date"])
-    df_corr_doc["month"] = df_corr_doc["the_date"].dt.month
-    df_corr_doc["day"] = df_corr_doc["the_date"].dt.day
-
-    corr_vars = ["EAC", "GI", "TM", "day", "hour", "month"]
+    # ---------- 同一組參數算過就直接回傳快取的 bytes ----------
+    cache_key = visualize_cache_key(
+        dataset,
+        apply_gi_tm=apply_gi_tm,
+        outlier_method=outlier_method,
+        iqr_factor=iqr_factor,
+        z_threshold=z_threshold,
+        isolation_contamination=isolation_contamination,
+        remove_outliers=remove_outliers,
+        scatter_mode=scatter_mode,
+        max_points=max_points,
+        density_bins=density_bins,
+        stages=stages,
+        sections=sections,
+        seasonal_ratio=seasonal_ratio,
+    ) + (media_type,)
+    cached = visualize_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type=media_type, headers={"Vary": "Accept"})
+
+    # ---------- 清理步驟鏈（和 /save-cleaned-data/ 共用，中間結果跨 request 快取） ----------
+    try:
+        steps = cleaning_steps(
+            apply_gi_tm=apply_gi_tm,
+            outlier_method=outlier_method,
+            iqr_factor=iqr_factor,
+            z_threshold=z_threshold,
+            isolation_contamination=isolation_contamination,
+            remove_outliers=remove_outliers,
+            seasonal_ratio=seasonal_ratio,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    run = PipelineRun(db, dataset, steps)
 
-    # 只在這裡算一次相關係數，後面三個 stage 都共用
-    corr_base = df_corr_doc[corr_vars].dropna()
+    # 欄式快照（memory-map），沒有才讀 DB
+    if run.source().empty:
+        raise HTTPException(status_code=404, detail="找不到資料")
 
-    corr_heatmap = {
-        "variables": ["EAC", "GI", "TM"],
-        "matrix": corr_base[["EAC", "GI", "TM"]].corr().values.tolist(),
-    }
-    corr_heatmap_full = {
-        "variables": corr_vars,
-        "matrix": corr_base.corr().values.tolist(),
+    scatter_opts = {
+        "scatter_mode": scatter_mode,
+        "max_points": max_points,
+        "density_bins": density_bins,
     }
 
-    # ---------- 主流程用 df（可清理） ----------
-    df = pd.DataFrame(
-        [
-            {
-                "EAC": e.eac,
-                "GI": e.gi,
-                "TM": e.tm,
-                "the_date": e.the_date,
-                "hour": e.the_hour,
-            }
-            for e in entries
-        ]
-    )
-    df = df.drop_duplicates(subset=["the_date", "hour"], keep="first")
-    df["the_date"] = pd.to_datetime(df["the_date"])
-    df["month"] = df["the_date"].dt.month
-    df["day"] = df["the_date"].dt.day
-
-    # ---------- Stage 1 資料：GI / TM 清理（和 notebook 同步） ----------
-    df1 = df.copy()
-    if apply_gi_tm:
-        # 只留 GI > 0 的日照時段
-        df1 = df1[df1["GI"] > 0].copy()
-        # 不合理的 TM 先設為 NaN 再插值
-        df1.loc[df1["TM"] <= 0, "TM"] = np.nan
-        df1 = df1.sort_values(["the_date", "hour"])
-        if df1["TM"].notna().sum() >= 2:
-            df1["TM"] = df1["TM"].interpolate("linear", limit_direction="both")
+    # ===============================
+    # 各 stage 都是 lazy：只要求 raw 就不做 GI/TM 清理；
+    # 要求 after_outlier 也只會算一次 df1（PipelineRun 內 memoize）
+    # ===============================
 
     # ---------- 相關係數：用和 notebook 一樣的資料來算 ----------
-    # 若有套 GI/TM 清理，相關係數就用 df1；否則用原始 df
-    corr_data = df1 if apply_gi_tm else df
-    corr_vars = ["EAC", "GI", "TM", "day", "hour", "month"]
-
-    corr_base = corr_data[corr_vars].dropna()
-    if len(corr_base) >= 2:
-        corr_heatmap = {
-            "variables": ["EAC", "GI", "TM"],
-            "matrix": corr_base[["EAC", "GI", "TM"]].corr().values.tolist(),
-        }
-        corr_heatmap_full = {
-            "variables": corr_vars,
-            "matrix": corr_base.corr().values.tolist(),
-        }
-    else:
-        # 資料太少就回傳空，前端自己處理
-        corr_heatmap = {"variables": ["EAC", "GI", "TM"], "matrix": []}
-        corr_heatmap_full = {"variables": corr_vars, "matrix": []}
-
-    # ---------- Stage 0：原始 ----------
-    outlier_mask_raw = pd.Series(False, index=df.index)
-    plots_raw = build_plots(
-        df,
-        outlier_mask=outlier_mask_raw,
-        remove_outliers=remove_outliers,
-        correlation_heatmap=corr_heatmap,
-        correlation_heatmap_full=corr_heatmap_full,
-    )
+    # 若有套 GI/TM 清理，相關係數就用 df1；否則 df1 就是原始 df
+    # 直接由上傳時存好的充分統計量算（不掃資料列）
+    @cache
+    def correlation():
+        return correlation_heatmaps(
+            dataset_moments(db, dataset, "gi_tm" if apply_gi_tm else "raw")
+        )
+
+    # ---------- Stage 2：離群值標記 ----------
+    def stage2_mask():
+        return run.after("detect_outliers")[OUTLIER_FLAG]
 
-    # ---------- Stage 1：GI / TM 清理後（已在前面算好 df1） ----------
-    outlier_mask_stage1 = pd.Series(False, index=df1.index)
-
-    # ---------- Stage 2：離群值 ----------
-    df2 = df1.copy()
-    outlier_mask_stage2 = pd.Series(False, index=df2.index)
-
-    cols = ["EAC", "GI", "TM"]
-    if outlier_method == "iqr_single":
-        cols = ["EAC"]
-
-    if outlier_method != "none":
-        # IQR
-        if outlier_method.startswith("iqr"):
-            for col in cols:
-                s = df2[col].dropna()
-                if len(s) < 10:
-                    continue
-                q1, q3 = s.quantile([0.25, 0.75])
-                iqr = q3 - q1
-                if iqr == 0:
-                    continue
-                lower = q1 - iqr_factor * iqr
-                upper = q3 + iqr_factor * iqr
-                outlier_mask_stage2 |= (df2[col] < lower) | (df2[col] > upper)
-
-        # Z-score
-        elif outlier_method == "zscore":
-            for col in cols:
-                s = df2[col].dropna()
-                if len(s) == 0 or s.std() == 0:
-                    continue
-                z = np.abs((df2[col] - s.mean()) / s.std())
-                outlier_mask_stage2 |= z > z_threshold
-
-        # Isolation Forest
-        elif outlier_method == "isolation_forest":
-            sub = df2[cols].dropna()
-            if len(sub) > 20:
-                iso = IsolationForest(
-                    contamination=isolation_contamination, random_state=42
-                )
-                pred = iso.fit_predict(sub)
-                mask = pd.Series(pred == -1, index=sub.index)
-                outlier_mask_stage2.loc[mask.index] = mask
-
-        # Stage0 / Stage1 的 outlier 標記（只用來畫圖）
-        outlier_mask_raw = outlier_mask_stage2.reindex(df.index, fill_value=False)
-        outlier_mask_stage1 = outlier_mask_stage2.reindex(df1.index, fill_value=False)
-
-        plots_raw = build_plots(
+    def plots(df, outlier_mask):
+        corr_heatmap, corr_heatmap_full = correlation() if "corr" in sections else (None, None)
+        return build_plots(
             df,
-            outlier_mask=outlier_mask_raw,
-            remove_outliers=remove_outliers,
-            correlation_heatmap=corr_heatmap,
-            correlation_heatmap_full=corr_heatmap_full,
-        )
-        plots_stage1 = build_plots(
-            df1,
-            outlier_mask=outlier_mask_stage1,
+            outlier_mask=outlier_mask,
             remove_outliers=remove_outliers,
             correlation_heatmap=corr_heatmap,
             correlation_heatmap_full=corr_heatmap_full,
+            sections=sections,
+            **scatter_opts,
         )
 
-        # Stage2：真的移除 + 補值 或 只標記
-        if remove_outliers:
-            df2.loc[outlier_mask_stage2, cols] = np.nan
-            df2 = df2.sort_values(["the_date", "hour"])
-            df2[cols] = df2[cols].interpolate("linear", limit_direction="both")
-            plots_stage2 = build_plots(
-                df2,
-                outlier_mask=pd.Series(False, index=df2.index),
-                remove_outliers=remove_outliers,
-                correlation_heatmap=corr_heatmap,
-                correlation_heatmap_full=corr_heatmap_full,
+    has_outlier = outlier_method != "none"
+    result_stages = {}
+
+    # Stage0 / Stage1 的 outlier 標記（只用來畫圖）
+    if "raw" in stages:
+        df = run.after("calendar")
+        mask = stage2_mask().reindex(df.index, fill_value=False) if has_outlier else None
+        result_stages["raw"] = plots(df, mask)
+
+    if "after_gi_tm" in stages:
+        df1 = run.after("gi_tm")
+        mask = stage2_mask() if has_outlier else None
+        result_stages["after_gi_tm"] = plots(df1, mask)
+
+    if "after_outlier" in stages:
+        if not has_outlier:
+            # 沒做離群值：Stage1 / Stage2 就是同一份 df1
+            result_stages["after_outlier"] = (
+                result_stages.get("after_gi_tm") or plots(run.after("gi_tm"), None)
             )
+        elif remove_outliers:
+            # Stage2：真的移除 + 補值
+            result_stages["after_outlier"] = plots(run.after("interpolate_outliers"), None)
         else:
-            plots_stage2 = build_plots(
-                df2,
-                outlier_mask=outlier_mask_stage2,
-                remove_outliers=remove_outliers,
-                correlation_heatmap=corr_heatmap,
-                correlation_heatmap_full=corr_heatmap_full,
-            )
+            result_stages["after_outlier"] = plots(run.after("gi_tm"), stage2_mask())
+
+    body = encode({"stages": result_stages}, media_type)
+    visualize_cache.put(cache_key, body)
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+# ===============================
+# 門檻掃描：一次回傳整組門檻的離群列數（前端 slider 預覽用）
+# ===============================
+@router.get("/visualize-data/threshold-sweep")
+def threshold_sweep_preview(
+    dataset_id: int | None = Query(None),
+    file_name: str | None = Query(None),
+    site_id: int | None = Query(None),
+    apply_gi_tm: bool = Query(True),
+    outlier_method: str = Query(
+        "iqr", pattern="^(iqr|iqr_single|zscore|isolation_forest|seasonal_robust)$"
+    ),
+    thresholds: str | None = Query(None),
+    seasonal_ratio: bool = Query(True),
+    accept: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    # thresholds：逗號分隔；沒給就用預設格點
+    if thresholds:
+        try:
+            grid = np.array(sorted({float(t) for t in thresholds.split(",") if t.strip()}))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="thresholds 必須是逗號分隔的數字")
     else:
-        # 沒做離群值：Stage1 / Stage2 就是同一份 df1
-        plots_stage1 = build_plots(
-            df1,
-            outlier_mask=outlier_mask_stage1,
-            remove_outliers=remove_outliers,
-            correlation_heatmap=corr_heatmap,
-            correlation_heatmap_full=corr_heatmap_full,
-        )
-        plots_stage2 = build_plots(
-            df1,
-            outlier_mask=outlier_mask_stage1,
-            remove_outliers=remove_outliers,
-            correlation_heatmap=corr_heatmap,
-            correlation_heatmap_full=corr_heatmap_full,
-        )
+        grid = DEFAULT_GRIDS["iqr" if outlier_method.startswith("iqr") else outlier_method]
+    if len(grid) == 0 or len(grid) > 1000:
+        raise HTTPException(status_code=400, detail="thresholds 數量需介於 1 ~ 1000")
+    if outlier_method == "isolation_forest" and not ((grid > 0) & (grid <= 0.5)).all():
+        raise HTTPException(status_code=400, detail="isolation_forest 的 contamination 需介於 (0, 0.5]")
+
+    dataset = find_dataset(db, dataset_id, file_name, site_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="找不到資料")
+
+    media_type = negotiate(accept)
+    cache_key = (
+        dataset.dataset_id,
+        dataset.version,
+        "threshold-sweep",
+        bool(apply_gi_tm),
+        outlier_method,
+        bool(seasonal_ratio) if outlier_method == "seasonal_robust" else None,
+        tuple(grid.tolist()),
+        media_type,
+    )
+    cached = visualize_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type=media_type, headers={"Vary": "Accept"})
+
+    # 和 /visualize-data/ 同一條 Stage 1 步驟鏈，快取共用
+    run = PipelineRun(db, dataset, cleaning_steps(apply_gi_tm=apply_gi_tm))
+    if run.source().empty:
+        raise HTTPException(status_code=404, detail="找不到資料")
+
+    result = threshold_sweep(
+        run.frame(),
+        outlier_method,
+        outlier_columns(outlier_method),
+        grid,
+        seasonal_ratio=seasonal_ratio,
+    )
+
+    body = encode(result, media_type)
+    visualize_cache.put(cache_key, body)
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+# ===============================
+# 摘要模式：欄位統計 / 箱型圖 / 離群列 id 全部在資料庫端聚合
+# 不讀快照、不把資料列載入 pandas（大 dataset 只看摘要時用）
+# ===============================
+@router.get("/visualize-data/summary")
+def visualize_summary(
+    dataset_id: int | None = Query(None),
+    file_name: str | None = Query(None),
+    site_id: int | None = Query(None),
+    apply_gi_tm: bool = Query(True),
+    outlier_method: str = Query("none", pattern="^(none|iqr|iqr_single|zscore)$"),
+    iqr_factor: float = Query(1.5),
+    z_threshold: float = Query(DEFAULT_Z_THRESHOLD),
+    remove_outliers: bool = Query(False),
+    sections: str | None = Query(None),
+    include_ids: bool = Query(True),
+    accept: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    # sections 只接受箱型圖（欄位統計一定會回傳）
+    sections = parse_selector(sections, tuple(BOX_SECTIONS), "sections")
+    dataset = find_dataset(db, dataset_id, file_name, site_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="找不到資料")
+
+    param = z_threshold if outlier_method == "zscore" else iqr_factor
+    media_type = negotiate(accept)
+    cache_key = (
+        dataset.dataset_id,
+        dataset.version,
+        "summary",
+        bool(apply_gi_tm),
+        outlier_method,
+        round(param, 6) if outlier_method != "none" else None,
+        bool(remove_outliers),
+        sections,
+        bool(include_ids),
+        media_type,
+    )
+    cached = visualize_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type=media_type, headers={"Vary": "Accept"})
+
+    result = summarize(
+        db,
+        dataset.dataset_id,
+        apply_gi_tm=apply_gi_tm,
+        method=outlier_method,
+        param=param,
+        groups=tuple(BOX_SECTIONS[s] for s in sections),
+        show_outliers=not remove_outliers,
+        include_ids=include_ids,
+    )
+    if result["total_rows"] == 0 and not dataset.row_count:
+        raise HTTPException(status_code=404, detail="找不到資料")
+
+    body = encode(result, media_type)
+    visualize_cache.put(cache_key, body)
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+# ===============================
+# 相關係數熱圖：dataset 或整個案場（各 dataset 的統計量相加）
+# ===============================
+@router.get("/visualize-data/correlation")
+def visualize_correlation(
+    dataset_id: int | None = Query(None),
+    file_name: str | None = Query(None),
+    site_id: int | None = Query(None),
+    apply_gi_tm: bool = Query(True),
+    accept: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    stage = "gi_tm" if apply_gi_tm else "raw"
+    if site_id is not None:
+        moments = site_moments(db, site_id, stage)
+    else:
+        dataset = find_dataset(db, dataset_id, file_name)
+        if not dataset:
+            raise HTTPException(status_code=404, detail="找不到資料")
+        moments = dataset_moments(db, dataset, stage)
+
+    corr_heatmap, corr_heatmap_full = correlation_heatmaps(moments)
+    media_type = negotiate(accept)
+    body = encode(
+        {
+            "n": moments.n,
+            "correlation_heatmap": corr_heatmap,
+            "correlation_heatmap_full": corr_heatmap_full,
+        },
+        media_type,
+    )
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+# ===============================
+# 資料缺漏：連續小時格點上沒有資料列的區段
+# ===============================
+@router.get("/visualize-data/gaps")
+def visualize_gaps(
+    dataset_id: int | None = Query(None),
+    file_name: str | None = Query(None),
+    site_id: int | None = Query(None),
+    min_length: int = Query(1, ge=1),
+    accept: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    dataset = find_dataset(db, dataset_id, file_name, site_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="找不到資料")
 
-    return safe_json(
+    df = PipelineRun(db, dataset, []).source()
+    if df.empty:
+        raise HTTPException(status_code=404, detail="找不到資料")
+
+    grid = HourGrid.from_frame(df)
+    starts, lengths = grid.gaps()
+    keep = lengths >= min_length
+
+    media_type = negotiate(accept)
+    body = encode(
         {
-            "stages": {
-                "raw": plots_raw,
-                "after_gi_tm": plots_stage1,
-                "after_outlier": plots_stage2,
-            }
-        }
+            "start": str(grid.start),
+            "end": str(grid.start + np.timedelta64(len(grid) - 1, "h")),
+            "hours": len(grid),
+            "present_hours": int(grid.present.sum()),
+            "missing_hours": int(len(grid) - grid.present.sum()),
+            "gaps": {
+                "start": np.datetime_as_string(starts[keep], unit="h").tolist(),
+                "length": lengths[keep],
+            },
+        },
+        media_type,
     )
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+# ===============================
+# 快取命中率
+# ===============================
+@router.get("/visualize-data/cache-stats")
+def visualize_cache_stats():
+    return visualize_cache.stats()
 
 # ===============================
 # 儲存清理後資料（原本的即可）
 # ===============================
 @router.post("/save-cleaned-data/")
 def save_cleaned_data(payload: dict, db: Session = Depends(get_db)):
+    dataset_id = payload.get("dataset_id")
     file_name = payload.get("file_name")
+    site_id = payload.get("site_id")
     apply_gi_tm = payload.get("apply_gi_tm", True)
     outlier_method = payload.get("outlier_method", "none")
     remove_outliers = payload.get("remove_outliers", True)
 
-    if not file_name:
-        raise HTTPException(status_code=400, detail="缺少 file_name")
+    if not dataset_id and not file_name:
+        raise HTTPException(status_code=400, detail="缺少 dataset_id 或 file_name")
 
-    entries = db.query(SiteData).filter(SiteData.data_name == file_name).all()
-    if not entries:
+    dataset = find_dataset(db, dataset_id, file_name, site_id)
+    if not dataset:
         raise HTTPException(status_code=404, detail="找不到原始資料")
 
-    data_id = entries[0].data_id
-
-    df_raw = pd.DataFrame(
-        [
-            {
-                "EAC": e.eac,
-                "GI": e.gi,
-                "TM": e.tm,
-                "the_date": e.the_date,
-                "hour": e.the_hour,
-            }
-            for e in entries
-        ]
-    ).drop_duplicates(subset=["the_date", "hour"], keep="first")
+    def param(key, default):
+        value = payload.get(key)
+        return default if value is None else float(value)
+
+    # 和 /visualize-data/ 預覽同一條步驟鏈：預覽過的設定直接命中快取
+    try:
+        steps = cleaning_steps(
+            apply_gi_tm=apply_gi_tm,
+            outlier_method=outlier_method,
+            iqr_factor=param("iqr_factor", 1.5),
+            z_threshold=param("z_threshold", DEFAULT_Z_THRESHOLD),
+            isolation_contamination=param("isolation_contamination", 0.1),
+            remove_outliers=remove_outliers,
+            seasonal_ratio=payload.get("seasonal_ratio", True),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    run = PipelineRun(db, dataset, steps)
 
-    before_rows = len(df_raw)
+    df_raw = run.source()
+    if df_raw.empty:
+        raise HTTPException(status_code=404, detail="找不到原始資料")
+
+    data_id = first_data_id(db, dataset.dataset_id)
 
-    df = df_raw.copy()
-    if apply_gi_tm:
-        df = df[df["GI"] > 0].copy()
-        df.loc[df["TM"] <= 0, "TM"] = np.nan
-        df = df.sort_values(["the_date", "hour"])
-        if df["TM"].notna().sum() >= 2:
-            df["TM"] = df["TM"].interpolate("linear", limit_direction="both")
+    before_rows = len(df_raw)
 
-    if outlier_method != "none" and remove_outliers:
-        df = df.dropna()
+    # 離群值設為 NaN 後補值（和預覽的 after_outlier 一致）；補不到的離群值整列刪除，算在 after_rows 裡
+    df = run.frame()
+    detected = run.after("detect_outliers")
+    outlier_rows = int(detected[OUTLIER_FLAG].sum()) if OUTLIER_FLAG in detected.columns else 0
+    unfilled_rows = len(detected) - len(df) if remove_outliers and outlier_method != "none" else 0
 
     after_rows = len(df)
 
     outlier_params = None
     if outlier_method.startswith("iqr"):
-        outlier_params = {"iqr_factor": payload.get("iqr_factor")}
+        outlier_params = {"iqr_factor": param("iqr_factor", 1.5)}
     elif outlier_method == "zscore":
-        outlier_params = {"z_threshold": payload.get("z_threshold")}
+        outlier_params = {"z_threshold": param("z_threshold", DEFAULT_Z_THRESHOLD)}
     elif outlier_method == "isolation_forest":
+        outlier_params = {"contamination": param("isolation_contamination", 0.1)}
+    elif outlier_method == "seasonal_robust":
         outlier_params = {
-            "contamination": payload.get("isolation_contamination")
+            "z_threshold": param("z_threshold", DEFAULT_Z_THRESHOLD),
+            "use_ratio": bool(payload.get("seasonal_ratio", True)),
         }
+    if outlier_params is not None:
+        outlier_params["outlier_rows"] = outlier_rows
+        outlier_params["interpolated"] = bool(remove_outliers)
+        outlier_params["unfilled_rows"] = unfilled_rows
 
     after = AfterData(
         data_id=data_id,
-        after_name=f"{file_name}_cleaned",
+        dataset_id=dataset.dataset_id,
+        after_name=f"{dataset.file_name}_cleaned",
         before_rows=before_rows,
         after_rows=after_rows,
         removed_ratio=(before_rows - after_rows) / before_rows if before_rows > 0 else 0,
@@ -425,8 +629,14 @@ def save_cleaned_data(payload: dict, db: Session = Depends(get_db)):
     )
 
     db.add(after)
+    db.flush()
+
+    # 清理後的逐列資料（含 is_outlier）一起存，下游直接讀，不用重跑清理
+    rows = cleaned_rows(df)
+    save_cleaned_rows(db, after.after_id, rows)
     db.commit()
     db.refresh(after)
+    write_cleaned_snapshot(after.after_id, rows)
 
     return {
         "message": "清理完成",
@@ -435,5 +645,8 @@ def save_cleaned_data(payload: dict, db: Session = Depends(get_db)):
         "removed_ratio": round(
             (before_rows - after_rows) / before_rows if before_rows > 0 else 0, 3
         ),
+        "outlier_rows": outlier_rows,
+        "unfilled_rows": unfilled_rows,
         "after_id": after.after_id,
+        "dataset_id": dataset.dataset_id,
     }
\ No newline at end of file
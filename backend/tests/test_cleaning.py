@@ -0,0 +1,64 @@
+# tests/test_cleaning.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from processors.cleaning import OUTLIER_FLAG, cleaning_steps
+
+
+def daily_cycle(days: int = 60, seed: int = 0) -> pd.DataFrame:
+    """每小時一列、有日夜週期的資料（夜間 GI = 0，會被 gi_tm 濾掉），欄位和 PipelineRun.source() 相同"""
+    rng = np.random.default_rng(seed)
+    n = days * 24
+    hour = np.arange(n) % 24
+    sun = np.clip(np.sin((hour - 6) / 12 * np.pi), 0, None)
+    gi = sun * (0.8 + 0.2 * rng.random(n))
+    return pd.DataFrame(
+        {
+            "the_date": pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(n) // 24, unit="D"),
+            "hour": hour.astype(np.int8),
+            "GI": gi,
+            "TM": 20 + 10 * sun + rng.normal(0, 1, n),
+            "EAC": gi * 100 * (0.95 + 0.05 * rng.random(n)),
+        }
+    )
+
+
+def run_steps(df: pd.DataFrame, **options) -> pd.DataFrame:
+    for step in cleaning_steps(**options):
+        df = step.run(df)
+    return df
+
+
+@pytest.mark.parametrize("method", ["isolation_forest", "iqr", "zscore", "seasonal_robust"])
+def test_interpolated_outliers_leave_no_nan_rows(method):
+    df = daily_cycle()
+    detected = run_steps(df, outlier_method=method, isolation_contamination=0.1)
+    cleaned = run_steps(df, outlier_method=method, isolation_contamination=0.1, remove_outliers=True)
+
+    # 補不到的離群值整列刪除，而不是留下 NaN
+    assert not cleaned[["GI", "TM", "EAC"]].isna().all(axis=1).any()
+    assert not cleaned.loc[cleaned[OUTLIER_FLAG], ["GI", "TM", "EAC"]].isna().any(axis=None)
+
+    # 沒被標記的列原封不動
+    kept = detected[~detected[OUTLIER_FLAG]]
+    assert len(cleaned) == len(kept) + int(cleaned[OUTLIER_FLAG].sum())
+    pd.testing.assert_frame_equal(cleaned[~cleaned[OUTLIER_FLAG]], kept)
+
+
+def test_dawn_dusk_outliers_are_filled_not_dropped():
+    df = daily_cycle()
+    # 每天第一個（7 點）與最後一個（17 點）日照小時的 EAC 放大 10 倍：前後都是被濾掉的夜間
+    edge = df["hour"].isin([7, 17]) & (df["the_date"].dt.day % 5 == 0)
+    df.loc[edge, "EAC"] *= 10
+
+    detected = run_steps(df, outlier_method="zscore")
+    cleaned = run_steps(df, outlier_method="zscore", remove_outliers=True)
+
+    flagged = detected[detected[OUTLIER_FLAG]]
+    assert flagged["hour"].isin([7, 17]).all() and len(flagged) == int(edge.sum())
+    # 沒有任何列因為補不到而被刪掉，補上的值是同一段日照時段內的正常值
+    assert len(cleaned) == len(detected)
+    filled = cleaned.loc[flagged.index]
+    assert not filled[["GI", "TM", "EAC"]].isna().any(axis=None)
+    assert (filled["EAC"] < df.loc[flagged.index, "EAC"] / 3).all()